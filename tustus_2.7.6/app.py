@@ -1,10 +1,14 @@
 from __future__ import annotations
-import asyncio, logging, os, sys, sqlite3
+import asyncio, datetime, logging, os, sys, sqlite3
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler
-from config import BOT_TOKEN, INTERVAL, DB_PATH, LOG_LEVEL, LOG_FORMAT, LOG_TO_FILE, LOG_FILE
+import aiohttp
+from config import BOT_TOKEN, INTERVAL, MONITOR_MIN_INTERVAL, MONITOR_MAX_INTERVAL, DB_PATH, LOG_LEVEL, LOG_FORMAT, LOG_TO_FILE, LOG_FILE
+import config
 import db
+import http_client
 import logic as lg
-from handlers import handle_start, handle_callback  # type: ignore
+from scheduler import AdaptiveInterval
+from handlers import handle_start, handle_callback, handle_search, invalidate_screens  # type: ignore
 
 # logging
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
@@ -17,28 +21,90 @@ if LOG_TO_FILE:
 
 def _ensure_db():
     conn = db.get_conn(DB_PATH)
+    db.ensure_schema(conn)
     conn.close()
     log.info("✅ DB schema ensured")
     log.info("📁 DB path: %s", os.path.abspath(DB_PATH))
 
+_MONITOR_LOCK = asyncio.Lock()
+_MAINTENANCE_RUNNING = False  # התחזוקה מחזיקה את _MONITOR_LOCK — טיק שמגיע ממתין במקום לדלג
+
 async def _job_monitor(context):
-    # open a process-wide connection for read-only ops
-    conn = db.get_conn(DB_PATH)
-    try:
-        await lg.run_monitor(conn, context.application)
-    except Exception as e:
-        log.exception("run_monitor tick failed")
-    finally:
-        conn.close()
+    # fetch/parse/write רצים מחוץ ל-event loop (ראה logic.run_monitor)
+    if _MONITOR_LOCK.locked() and not _MAINTENANCE_RUNNING:
+        # הטיק הקודם עוד רץ; הוא זה שיתזמן את הבא
+        log.warning("monitor tick skipped: previous tick still running")
+        return
+    app = context.application
+    changed = error = False
+    async with _MONITOR_LOCK:
+        try:
+            ins, upd = await lg.run_monitor(app.bot_data["db_writer"], app)
+            changed = bool(ins or upd)
+            if changed:
+                invalidate_screens(app.bot_data)  # המקלדות שב-cache נבנו מהנתונים הקודמים
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = True
+            log.warning("monitor fetch failed: %s", e)
+        except Exception as e:
+            log.exception("run_monitor tick failed")
+        finally:
+            # הטיק הבא מתוזמן רק אחרי שהנוכחי הסתיים — אין חפיפה
+            delay = app.bot_data["monitor_interval"].next_delay(changed=changed, error=error)
+            context.job_queue.run_once(_job_monitor, when=delay, name="monitor")
+            log.info("next monitor tick in %.1fs (changed=%s, error=%s)", delay, changed, error)
+
+async def _job_maintenance(context):
+    # ארכיון/דילול/checkpoint/vacuum (maintenance.py). תחת _MONITOR_LOCK: archive_stale מוחק שורות
+    # וה-caches של המוניטור מתעדכנים, אז אסור שטיק ירוץ באמצע. טיק שמגיע בינתיים ממתין ולא מדלג,
+    # כדי שהתזמון העצמי שלו לא ייקטע
+    global _MAINTENANCE_RUNNING
+    app = context.application
+    async with _MONITOR_LOCK:
+        _MAINTENANCE_RUNNING = True
+        try:
+            res = await app.bot_data["db_writer"].call(lg.run_maintenance)
+            lg.forget_archived(res.pop("archived_keys"))
+            if res["archived"]:
+                invalidate_screens(app.bot_data)
+            log.info("maintenance done | archived=%d | db=%.1fMB wal=%.1fMB freelist=%d",
+                     res["archived"], res["after"]["db_bytes"] / 2**20,
+                     res["after"]["wal_bytes"] / 2**20, res["after"]["freelist_pages"])
+        except Exception:
+            log.exception("maintenance failed")
+        finally:
+            _MAINTENANCE_RUNNING = False
+
+async def _post_init(app: Application):
+    # חיבורי ה-DB חיים כמו ה-Application: writer אחד + pool קריאה ל-handlers
+    manager = db.open_manager(DB_PATH)
+    app.bot_data["db_writer"] = manager.writer
+    app.bot_data["monitor_interval"] = AdaptiveInterval()
+    app.bot_data["render_gen"] = 0
+
+async def _post_shutdown(app: Application):
+    await http_client.close_client()
+    app.bot_data.pop("db_writer", None)
+    db.close_manager()
 
 def main():
     _ensure_db()
-    app = Application.builder().token(BOT_TOKEN).build()
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
+        .build()
+    )
     app.add_handler(CommandHandler("start", handle_start))
+    app.add_handler(CommandHandler("search", handle_search))
     app.add_handler(CallbackQueryHandler(handle_callback))
     # job queue
-    app.job_queue.run_repeating(_job_monitor, interval=INTERVAL, first=5, name="monitor")
-    log.info("🚀 הפעלה | interval=%ss | DB=%s", INTERVAL, DB_PATH)
+    # job queue: טיק ראשון אחרי 5 שניות; כל טיק מתזמן את הבא (scheduler.AdaptiveInterval)
+    app.job_queue.run_once(_job_monitor, when=5, name="monitor")
+    hh, mm = map(int, getattr(config, "MAINTENANCE_AT", "01:30").split(":"))
+    app.job_queue.run_daily(_job_maintenance, time=datetime.time(hh, mm), name="maintenance")
+    log.info("🚀 הפעלה | interval=%ss (%s-%ss) | DB=%s", INTERVAL, MONITOR_MIN_INTERVAL, MONITOR_MAX_INTERVAL, DB_PATH)
     app.run_polling(allowed_updates=["message","callback_query"])
 
 if __name__ == "__main__":
@@ -0,0 +1,633 @@
+#!/usr/bin/env python3
+# bench_db.py — benchmarks לשכבת ה-DB (אופליין, על קובץ SQLite זמני)
+#
+#   python bench_db.py upsert --rows 10000 100000
+#   python bench_db.py tick --rows 10000 --changed 0.01
+#   python bench_db.py reads --rows 10000 --calls 2000
+#   python bench_db.py schema --calls 2000
+#   python bench_db.py plans                 # EXPLAIN QUERY PLAN לשאילתות החמות; exit 1 על רגרסיה
+#   python bench_db.py stress --rows 20000 --clients 20   # latency של callbacks בזמן טיק כתיבה
+#   python bench_db.py load --rows 100000 --burst 200     # burst של callbacks: inline מול facade אסינכרוני
+#   python bench_db.py search --rows 100000               # /search: FTS5 מול LIKE '%..%'
+#   python bench_db.py search-check                       # /search על כרטיסים אמיתיים מה-snapshot; exit 1 על שגיאה
+#   python bench_db.py dates --rows 100000                # סינון תאריכים/אורך טיול: julianday() לשורה מול אינדקס
+#   python bench_db.py render --dests 300 --taps 2000     # מקלדת היעדים לכל לחיצה: DB + בנייה מול KeyboardCache
+from __future__ import annotations
+import argparse, asyncio, pathlib, random, re, sqlite3, sys, tempfile, time
+from datetime import date, timedelta
+
+import db
+import logic
+
+SYNTH_REF = date(2025, 8, 1)  # "יום הסריקה" של הנתונים הסינתטיים
+
+def synth_rows(n: int, seed: int = 7) -> list:
+    """n שורות בסכמת _parse_card, עם יעדים ומחירים מגוונים."""
+    rng = random.Random(seed)
+    srng = random.Random(seed + 1)  # לו"ז: rng נפרד, כדי שהמחירים יישארו כמו בריצות קודמות
+    cities = [("אתונה", "יוון"), ("לרנקה", "קפריסין"), ("בודפשט", "הונגריה"), ("פראג", "צ'כיה"),
+              ("טיבט", "מונטנגרו"), ("זנזיבר", "טנזניה"), ("טירנה", "אלבניה"), ("רודוס", "יוון")]
+    rows = []
+    for i in range(n):
+        city, country = cities[i % len(cities)]
+        price = rng.randrange(90, 900)
+        row = {c: None for c in db.FLIGHT_COLS}
+        row.update({
+            "item_id": str(10000 + i // 4), "selapp_item": f"{380000 + i}_{i % 97}",
+            "category": str(rng.randrange(1, 12)), "provider": "Arkia", "affiliation": "",
+            "promo_category": "", "destination": f"{city} - {country}", "dest_city": city,
+            "dest_country": country, "trip_title": f"טיסה ל{city}", "price": float(price),
+            "currency": "USD", "price_text": f"${price}", "badge_text": "",
+            "out_from_city": "תל אביב", "out_from_time": "06:45", "out_to_city": city, "out_to_time": "08:55",
+            "out_duration": "2:10", "back_from_city": city, "back_from_time": "00:05",
+            "back_to_city": "תל אביב", "back_to_time": "01:50", "back_duration": "1:50",
+            "note": "", "more_like": "", "url": "https://www.tustus.co.il/Arkia/Home",
+        })
+        out = SYNTH_REF + timedelta(days=srng.randrange(120))
+        back = out + timedelta(days=srng.randrange(1, 10))
+        row.update(db.typed_schedule(f"יום ב' {out:%d/%m}", row["out_from_time"], f"יום ה' {back:%d/%m}",
+                                     row["back_from_time"], row["out_duration"], row["back_duration"], ref=SYNTH_REF))
+        rows.append(row)
+    return rows
+
+def _fresh_db(tmp: str, name: str) -> sqlite3.Connection:
+    path = pathlib.Path(tmp) / f"{name}.db"
+    path.unlink(missing_ok=True)
+    conn = db.get_conn(str(path))
+    db.ensure_schema(conn)
+    return conn
+
+# ---------- upsert ----------
+
+def _legacy_upsert(conn, row: dict) -> None:
+    # db.upsert_flight כפי שהיה: בונה את ה-SQL מחדש לכל שורה
+    cols = db.FLIGHT_COLS
+    vals = [row.get(c) for c in cols]
+    placeholders = ",".join("?" for _ in cols)
+    set_expr = ",".join(f"{c}=excluded.{c}" for c in cols if c not in ("item_id","selapp_item"))
+    sql = f"""
+    INSERT INTO flights ({",".join(cols)})
+    VALUES ({placeholders})
+    ON CONFLICT(item_id, selapp_item)
+    DO UPDATE SET {set_expr}, updated_at=CURRENT_TIMESTAMP, last_seen=CURRENT_TIMESTAMP
+    """
+    conn.execute(sql, vals)
+
+def legacy_write(conn, rows):
+    # לולאת monitor_job הישנה: SELECT לכל שורה ואז upsert
+    ins = upd = 0
+    with conn:
+        for row in rows:
+            exists = conn.execute(
+                "SELECT 1 FROM flights WHERE item_id=? AND selapp_item=?",
+                (row["item_id"], row["selapp_item"])
+            ).fetchone()
+            _legacy_upsert(conn, row)
+            if exists:
+                upd += 1
+            else:
+                ins += 1
+    return ins, upd
+
+def bulk_write(conn, rows):
+    with conn:
+        return db.upsert_flights(conn, rows)
+
+def bench_upsert(sizes) -> list:
+    out = []
+    with tempfile.TemporaryDirectory(prefix="tustus_bench_db_") as tmp:
+        for n in sizes:
+            rows = synth_rows(n)
+            for name, fn in (("legacy", legacy_write), ("bulk", bulk_write)):
+                conn = _fresh_db(tmp, f"{name}_{n}")
+                for phase in ("insert", "update"):
+                    t0 = time.perf_counter()
+                    ins, upd = fn(conn, rows)
+                    dt = time.perf_counter() - t0
+                    out.append({"rows": n, "path": name, "phase": phase, "inserted": ins, "updated": upd,
+                                "seconds": round(dt, 3), "rows_per_s": round(n / dt)})
+                conn.close()
+    return out
+
+# ---------- tick (diff מול תמונת זיכרון) ----------
+
+def _wal_bytes(conn) -> int:
+    path = pathlib.Path(conn.execute("PRAGMA database_list").fetchone()[2] + "-wal")
+    return path.stat().st_size if path.exists() else 0
+
+def _mutate(rows, frac: float, rnd: int) -> list:
+    # frac מהשורות מקבלות מחיר חדש; השאר זהות
+    rng = random.Random(rnd)
+    out = []
+    for r in rows:
+        if rng.random() < frac:
+            r = dict(r, price=r["price"] + 1 + rnd)
+        out.append(r)
+    return out
+
+def bench_tick(n: int, frac: float, ticks: int = 5) -> list:
+    """טיקים במצב יציב: upsert לכל השורות מול diff שכותב רק שינויים + last_seen אחד."""
+    out = []
+    rows = synth_rows(n)
+    with tempfile.TemporaryDirectory(prefix="tustus_bench_db_") as tmp:
+        for name in ("bulk", "diff"):
+            conn = _fresh_db(tmp, f"tick_{name}")
+            bulk_write(conn, rows)
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            image = db.FlightImage()
+            image.load(conn)
+            best, written, wal = float("inf"), 0, 0
+            for t in range(ticks):
+                tick = _mutate(rows, frac, t)
+                t0 = time.perf_counter()
+                if name == "bulk":
+                    bulk_write(conn, tick)
+                    written = len(tick)
+                else:
+                    diff = image.diff(tick)
+                    with conn:
+                        tick_at = conn.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0]
+                        db.upsert_flights(conn, diff.changed)
+                        db.touch_ids(conn, diff.touch_ids)
+                        entries = image.entries_for(conn, diff.changed)
+                        db.bump_dest_seen(conn, tick_at)
+                    image.update(entries)
+                    written = len(diff.changed)
+                best = min(best, time.perf_counter() - t0)
+            wal = _wal_bytes(conn)
+            out.append({"rows": n, "path": name, "written": written, "seconds": round(best, 3),
+                        "wal_mb": round(wal / 2**20, 2)})
+            conn.close()
+    return out
+
+# ---------- reads (חיבור לכל קריאה מול pool) ----------
+
+def bench_reads(n: int, calls: int) -> list:
+    """שאילתת מקלדת היעדים, כמו לחיצה ב-handler: get_conn() חדש לכל קריאה מול ConnectionManager."""
+    out = []
+    with tempfile.TemporaryDirectory(prefix="tustus_bench_db_") as tmp:
+        conn = _fresh_db(tmp, "reads")
+        bulk_write(conn, synth_rows(n))
+        path = str(pathlib.Path(tmp) / "reads.db")
+        conn.close()
+
+        def per_call():
+            c = db.get_conn(path)
+            logic.get_dest_rows_for_keyboard(c)
+            c.close()
+
+        mgr = db.ConnectionManager(path, readers=2)
+
+        def pooled():
+            with mgr.reader() as c:
+                logic.get_dest_rows_for_keyboard(c)
+
+        for name, fn in (("per_call", per_call), ("pooled", pooled)):
+            lat = []
+            for _ in range(calls):
+                t0 = time.perf_counter()
+                fn()
+                lat.append(time.perf_counter() - t0)
+            lat.sort()
+            out.append({"rows": n, "path": name, "calls": calls,
+                        "p50_ms": round(lat[len(lat) // 2] * 1000, 3),
+                        "p99_ms": round(lat[min(len(lat) - 1, int(len(lat) * .99))] * 1000, 3)})
+        mgr.close()
+    return out
+
+# ---------- schema (DDL בכל קריאה מול user_version) ----------
+
+_CREATE_RE = re.compile(r"^CREATE (TABLE|INDEX|UNIQUE INDEX|TRIGGER|VIRTUAL TABLE) (?!IF NOT EXISTS)", re.IGNORECASE)
+
+def _replayable_ddl(conn) -> str:
+    """
+    הסכימה הנוכחית של הקובץ כ-CREATE ... IF NOT EXISTS (כמו ה-DDL ש-2.5.2 הריץ בכל קריאה).
+    לא schema_sql(): שם יש ALTER/UPDATE של ה-migrations, שלא ניתנים להרצה חוזרת על קובץ מעודכן.
+    טבלאות הצל של FTS5 נוצרות ע"י הטבלה הווירטואלית עצמה ולכן מדולגות.
+    """
+    vtabs = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE sql LIKE 'CREATE VIRTUAL TABLE%'")]
+    out = []
+    for name, sql in conn.execute("SELECT name, sql FROM sqlite_master "
+                                  "WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' ORDER BY rowid"):
+        if any(name.startswith(v + "_") for v in vtabs):
+            continue
+        out.append(_CREATE_RE.sub(lambda m: f"CREATE {m.group(1)} IF NOT EXISTS ", sql) + ";")
+    return "\n".join(out)
+
+def bench_schema(calls: int) -> list:
+    """עלות לקריאה: executescript של כל ה-DDL + commit (כמו CRUD ב-2.5.2) מול migrate() על קובץ מעודכן."""
+    out = []
+    with tempfile.TemporaryDirectory(prefix="tustus_bench_db_") as tmp:
+        conn = _fresh_db(tmp, "schema")
+        ddl = _replayable_ddl(conn)
+
+        def legacy(c):
+            c.executescript(ddl)
+            c.commit()
+
+        for name, fn in (("ddl_per_call", legacy), ("user_version", db.ensure_schema)):
+            t0 = time.perf_counter()
+            for _ in range(calls):
+                fn(conn)
+            dt = time.perf_counter() - t0
+            out.append({"path": name, "calls": calls, "us_per_call": round(dt / calls * 1e6, 1)})
+        conn.close()
+    return out
+
+# ---------- plans (שמירה מפני רגרסיה בתוכניות השאילתות) ----------
+
+# שאילתות שרצות בכל לחיצה / טיק: אסור שיסרקו טבלה גדולה בלי covering index או ימיינו ב-temp b-tree.
+# dest_stats קטנה (שורה ליעד) — סריקה ומיון שלה מותרים.
+# "SCAN flights_fts VIRTUAL TABLE" הוא חיפוש באינדקס FTS5 (מחזיר רק התאמות), ולכן גם המיון לפי bm25 בסדר.
+SMALL_TABLES = {"dest_stats", "flights_fts"}
+HOT_QUERIES = {
+    "dest_keyboard": (db.DEST_KEYBOARD_SQL, ()),
+    "dest_summary": (db.DEST_SUMMARY_SQL, (50,)),
+    "distinct_city_country": (db.DISTINCT_CITY_COUNTRY_SQL, ()),
+    "flight_history": ("SELECT ts, price FROM flight_history WHERE flight_id=? ORDER BY ts DESC LIMIT 100", (1,)),
+    "price_drops_since": ("SELECT h.ts, f.dest_city FROM flight_history AS h JOIN flights AS f ON f.id = h.flight_id "
+                          "WHERE h.price_delta < 0 AND h.ts >= ? ORDER BY h.ts DESC LIMIT 200", (0,)),
+    "search": (db.SEARCH_SQL, (db.fts_query("אתונ"), 10)),
+    "flights_by_dates": db.flights_query_sql("2025-09-01", "2025-09-07"),
+    "flights_by_trip": db.flights_query_sql("2025-09-01", "2025-10-31", min_days=3, max_days=5),
+    "flights_by_dest": db.flights_query_sql("2025-09-01", None, min_days=4, city_key="אתונה", country_key="יוון"),
+}
+
+def _plan_problems(plan: list) -> list:
+    small = any(d.startswith("SCAN ") and d.split()[1] in SMALL_TABLES for d in plan)
+    bad = []
+    for d in plan:
+        if d.startswith("SCAN ") and d.split()[1] not in SMALL_TABLES and "COVERING INDEX" not in d:
+            bad.append("table scan")
+        if "USE TEMP B-TREE" in d and not small:
+            bad.append("temp b-tree sort")
+    return bad
+
+def check_plans(n: int) -> int:
+    """מחזיר מספר השאילתות שהתוכנית שלהן לא תקינה (0 = הכל בסדר)."""
+    failed = 0
+    with tempfile.TemporaryDirectory(prefix="tustus_bench_db_") as tmp:
+        conn = _fresh_db(tmp, "plans")
+        bulk_write(conn, synth_rows(n))
+        # היסטוריה סינתטית (5 שינויים לטיסה, ~חצי ירידות) כדי ש-ANALYZE יראה התפלגות אמיתית
+        rng = random.Random(3)
+        now = int(time.time())
+        with conn:
+            conn.executemany(db.HISTORY_INSERT_SQL, (
+                (fid, now - k * 3600, db.HIST_PRICE, 100.0, rng.choice((-10.0, 10.0)), None, None, None)
+                for fid in range(1, n + 1) for k in range(5)))
+        conn.execute("ANALYZE")
+        for name, (sql, params) in HOT_QUERIES.items():
+            plan = [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+            problems = _plan_problems(plan)
+            failed += bool(problems)
+            print(f"{'FAIL' if problems else 'ok  '} {name:22s} | {' ; '.join(plan)}"
+                  + (f"  <- {', '.join(problems)}" if problems else ""))
+        conn.close()
+    return failed
+
+# ---------- stress (callbacks במקביל לטיק) ----------
+
+def _pct(lat: list, q: float) -> float:
+    lat = sorted(lat)
+    return round(lat[min(len(lat) - 1, int(len(lat) * q))] * 1000, 2) if lat else 0.0
+
+async def _stress_run(mgr, mode: str, tick_rows, clients: int, period: float) -> dict:
+    """
+    clients "משתמשים" לוחצים כל period שניות (קריאת מקלדת היעדים + בניית המקלדת) כל עוד
+    הטיק רץ. loop = הכל על ה-event loop (הטיק וגם הקריאות, המודל המקורי),
+    inline = טיק ב-writer וקריאות סינכרוניות על ה-loop, executor = טיק ב-writer וקריאות ב-db.read.
+    """
+    from telegram_view import build_destinations_keyboard
+    lat: list = []
+
+    async def callback(t0: float):
+        # t0 = מתי הלחיצה "הגיעה"; latency כולל את זמן ההמתנה בתור כשה-loop חסום
+        if mode in ("loop", "inline"):
+            with mgr.reader() as conn:
+                rows = logic.get_dest_rows_for_keyboard(conn)
+        else:
+            rows = await mgr.read(logic.get_dest_rows_for_keyboard)
+        build_destinations_keyboard(rows, "*")
+        lat.append(time.perf_counter() - t0)
+
+    end = [float("inf")]  # לחיצות שהגיעו עד סוף הטיק נענות כולן, גם אם חיכו בתור
+
+    async def client(offset: float):
+        nxt = time.perf_counter() + offset
+        await asyncio.sleep(offset)
+        while nxt <= end[0]:
+            await callback(nxt)
+            nxt += period  # קצב הגעה קבוע, לא תלוי במהירות התשובה
+            await asyncio.sleep(max(0.0, nxt - time.perf_counter()))
+
+    tasks = [asyncio.create_task(client(period * i / clients)) for i in range(clients)]
+    t0 = time.perf_counter()
+    if tick_rows and mode == "loop":
+        await asyncio.sleep(period)  # שה-clients יתחילו לפני שהטיק תופס את ה-loop
+        wconn = db.get_conn(mgr.path)
+        logic._write_tick(wconn, "page", f"stress-{mode}", {}, tick_rows, [])
+        wconn.close()
+    elif tick_rows:
+        await mgr.writer.call(logic._write_tick, "page", f"stress-{mode}", {}, tick_rows, [])
+    else:
+        await asyncio.sleep(1.0)
+    end[0] = time.perf_counter()
+    tick_s = end[0] - t0
+    await asyncio.gather(*tasks)
+    return {"mode": mode, "tick": bool(tick_rows), "tick_s": round(tick_s, 2), "callbacks": len(lat),
+            "p50_ms": _pct(lat, .5), "p99_ms": _pct(lat, .99), "max_ms": _pct(lat, 1)}
+
+def bench_stress(n: int, clients: int, period: float) -> list:
+    out = []
+    with tempfile.TemporaryDirectory(prefix="tustus_bench_db_") as tmp:
+        conn = _fresh_db(tmp, "stress")
+        rows = synth_rows(n)
+        bulk_write(conn, rows)
+        conn.close()
+        mgr = db.ConnectionManager(str(pathlib.Path(tmp) / "stress.db"), readers=4)
+        for i, mode in enumerate(("loop", "inline", "executor")):
+            out.append(asyncio.run(_stress_run(mgr, mode, None, clients, period)))
+            # טיק שבו כל השורות השתנו: כתיבה מלאה + היסטוריה
+            tick = [dict(r, price=r["price"] + 1 + i) for r in rows]
+            out.append(asyncio.run(_stress_run(mgr, mode, tick, clients, period)))
+        mgr.close()
+        logic._FLIGHT_IMAGE.clear()
+    return out
+
+# ---------- load (burst של callbacks דרך ה-facade) ----------
+
+def _handler_reads(conn):
+    # מה ש-callback טיפוסי קורא: מקלדת, סיכום ורשימת יעדים
+    return db.dest_rows(conn), db.dest_summary(conn, 50), db.list_distinct_city_country(conn)
+
+async def _facade_reads():
+    return await asyncio.gather(db.fetch_dest_rows(), db.fetch_dest_summary(50), db.fetch_distinct_city_country())
+
+async def _load_run(mode: str, burst: int) -> dict:
+    """burst callbacks בבת אחת; במקביל probe שמודד כמה ה-event loop מאחר (loop lag)."""
+    lags, lat = [], []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            t = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - t - 0.001)
+
+    async def callback(t0: float):
+        # latency מרגע ההגעה (כל ה-burst מגיע יחד), כולל המתנה בתור
+        if mode == "inline":
+            with db.reader() as conn:
+                _handler_reads(conn)
+        else:
+            await _facade_reads()
+        lat.append(time.perf_counter() - t0)
+
+    p = asyncio.create_task(probe())
+    await asyncio.sleep(0.01)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(callback(t0) for _ in range(burst)))
+    wall = time.perf_counter() - t0
+    done.set()
+    await p
+    return {"mode": mode, "burst": burst, "wall_s": round(wall, 3), "p50_ms": _pct(lat, .5),
+            "p99_ms": _pct(lat, .99), "max_loop_lag_ms": round(max(lags) * 1000, 1)}
+
+def bench_load(n: int, burst: int) -> list:
+    out = []
+    with tempfile.TemporaryDirectory(prefix="tustus_bench_db_") as tmp:
+        conn = _fresh_db(tmp, "load")
+        bulk_write(conn, synth_rows(n))
+        conn.close()
+        db.open_manager(str(pathlib.Path(tmp) / "load.db"))
+        try:
+            for mode in ("inline", "facade"):
+                out.append(asyncio.run(_load_run(mode, burst)))
+        finally:
+            db.close_manager()
+    return out
+
+# ---------- search (FTS5 מול LIKE) ----------
+
+# שלוש מילים שמופיעות ב-1/8 מהשורות ושתיים שלא מופיעות בכלל (חיפוש של יעד שאין עליו טיסות)
+SEARCH_TERMS = ("אתונה", "יוו", "טיסה לבוד", "בנגקוק", "ניו יורק")
+_LIKE_SEARCH_SQL = """
+SELECT id, destination, dest_city, dest_country, trip_title, price, currency,
+       price_text, out_from_date, back_from_date, url
+FROM flights
+WHERE destination LIKE ?1 OR dest_city LIKE ?1 OR dest_country LIKE ?1 OR trip_title LIKE ?1 OR note LIKE ?1
+ORDER BY price
+LIMIT ?2
+"""
+
+def bench_search(n: int, calls: int) -> list:
+    """latency של /search: LIKE '%text%' (סריקת flights) מול MATCH על flights_fts."""
+    out = []
+    with tempfile.TemporaryDirectory(prefix="tustus_bench_db_") as tmp:
+        conn = _fresh_db(tmp, "search")
+        bulk_write(conn, synth_rows(n))
+        paths = (
+            ("like", lambda t: conn.execute(_LIKE_SEARCH_SQL, (f"%{t}%", 10)).fetchall()),
+            ("fts5", lambda t: db.search_flights(conn, t, 10)),
+        )
+        for name, fn in paths:
+            lat, hits = [], 0
+            for i in range(calls):
+                t0 = time.perf_counter()
+                hits += bool(fn(SEARCH_TERMS[i % len(SEARCH_TERMS)]))
+                lat.append(time.perf_counter() - t0)
+            out.append({"rows": n, "path": name, "calls": calls, "hit_ratio": round(hits / calls, 2),
+                        "p50_ms": _pct(lat, .5), "p99_ms": _pct(lat, .99)})
+        conn.close()
+    return out
+
+def check_search(snapshot) -> int:
+    """
+    /search על כרטיסים אמיתיים מה-snapshot: כל שורה בתשובה חייבת להציג את תאריך היציאה של הכרטיס
+    שלה (dd/mm, כפי שהמפענח קרא אותו). עמודה לא נכונה ב-SEARCH_SQL/render_search_results נכשלת כאן,
+    גם כשעל שורות סינתטיות היא "נראית" תקינה. מחזיר מספר הכשלונות (0 = הכל בסדר).
+    """
+    import telegram_view  # telegram נדרש רק כאן
+    items = logic.scrape_items(pathlib.Path(snapshot).read_text(encoding="utf-8"), "stream")
+    want = {(it["item_id"], it["selapp_item"]): it for it in items}
+    failed = 0
+    with tempfile.TemporaryDirectory(prefix="tustus_bench_db_") as tmp:
+        conn = _fresh_db(tmp, "search_check")
+        bulk_write(conn, items)
+        keys = {r[0]: (r[1], r[2]) for r in conn.execute("SELECT id, item_id, selapp_item FROM flights")}
+        for city in sorted({it["dest_city"] for it in items if it["dest_city"]}):
+            rows = db.search_flights(conn, city, 10)
+            lines = telegram_view.render_search_results(city, rows).splitlines()[1:]
+            problems = []
+            if not rows:
+                problems.append("no results")
+            for r, line in zip(rows, lines):
+                out = want[keys[r["id"]]]["out_date"]
+                if not out:
+                    problems.append(f"card {keys[r['id']]} has no parsed out_date")
+                elif f"| {date.fromisoformat(out).strftime('%d/%m')}" not in line:
+                    problems.append(f"expected {out} in: {line}")
+            failed += bool(problems)
+            print(f"{'FAIL' if problems else 'ok  '} {city:12s} | {len(rows)} rows"
+                  + (f"  <- {problems[0]}" if problems else ""))
+        conn.close()
+    return failed
+
+# ---------- dates (julianday לכל שורה מול עמודות מוקלדות) ----------
+
+# כמו query_flights_by_prefs ב-2.5.2: חישוב על כל שורה, אין אינדקס שיכול לעזור
+_JULIANDAY_SQL = """
+SELECT id, destination, price, out_date, back_date FROM flights
+WHERE julianday(out_date) BETWEEN julianday(?1) AND julianday(?2)
+  AND julianday(back_date) - julianday(out_date) + 1 BETWEEN ?3 AND ?4
+ORDER BY datetime(out_date) LIMIT 50
+"""
+
+def bench_dates(n: int, calls: int) -> list:
+    out = []
+    with tempfile.TemporaryDirectory(prefix="tustus_bench_db_") as tmp:
+        conn = _fresh_db(tmp, "dates")
+        bulk_write(conn, synth_rows(n))
+        conn.execute("ANALYZE")
+        rng = random.Random(5)
+        cases = []
+        for _ in range(calls):
+            start = SYNTH_REF + timedelta(days=rng.randrange(110))
+            lo = rng.randrange(2, 8)
+            cases.append((start, start + timedelta(days=rng.choice((3, 7, 14))), lo, lo + rng.randrange(3)))
+        paths = (
+            ("julianday", lambda a, b, lo, hi: conn.execute(_JULIANDAY_SQL, (a.isoformat(), b.isoformat(), lo, hi)).fetchall()),
+            ("indexed", lambda a, b, lo, hi: db.query_flights(conn, a, b, lo, hi)),
+        )
+        for name, fn in paths:
+            lat = []
+            for c in cases:
+                t0 = time.perf_counter()
+                fn(*c)
+                lat.append(time.perf_counter() - t0)
+            out.append({"rows": n, "path": name, "calls": calls, "p50_ms": _pct(lat, .5), "p99_ms": _pct(lat, .99)})
+        conn.close()
+    return out
+
+# ---------- render (מקלדת היעדים בכל לחיצה) ----------
+
+def bench_render(dests: int, taps: int) -> list:
+    """כמו handlers._build_main_screen: fetch_dest_rows + build_destinations_keyboard לכל לחיצה, מול KeyboardCache."""
+    import telegram_view  # telegram נדרש רק כאן
+    out = []
+    with tempfile.TemporaryDirectory(prefix="tustus_bench_db_") as tmp:
+        conn = _fresh_db(tmp, "render")
+        rows = synth_rows(dests * 10)
+        for i, r in enumerate(rows):
+            city, country = f"עיר{i % dests}", f"מדינה{i % dests % 40}"
+            r.update(dest_city=city, dest_country=country, destination=f"{city} - {country}")
+        bulk_write(conn, rows)
+        conn.close()
+        db.open_manager(str(pathlib.Path(tmp) / "render.db"))
+        cache = telegram_view.KeyboardCache()
+        selections = ["*"] + [f"עיר{i}|מדינה{i % 40}" for i in range(15)]
+
+        async def uncached(sel):
+            return telegram_view.build_destinations_keyboard(await db.fetch_dest_rows(), sel)
+
+        async def cached(sel):
+            km = cache.get(1, sel)
+            if km is None:
+                km = await uncached(sel)
+                cache.put(1, sel, km)
+            return km
+
+        async def run(fn):
+            lat = []
+            for i in range(taps):
+                t0 = time.perf_counter()
+                await fn(selections[i % len(selections)])
+                lat.append(time.perf_counter() - t0)
+            return lat
+
+        try:
+            for name, fn in (("rebuild", uncached), ("cached", cached)):
+                lat = asyncio.run(run(fn))
+                out.append({"dests": dests, "path": name, "taps": taps, "p50_ms": _pct(lat, .5),
+                            "p99_ms": _pct(lat, .99), "total_s": round(sum(lat), 3)})
+        finally:
+            db.close_manager()
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="DB layer benchmarks")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_up = sub.add_parser("upsert", help="per-row SELECT+upsert vs bulk executemany")
+    p_up.add_argument("--rows", nargs="+", type=int, default=[10_000, 100_000])
+    p_tick = sub.add_parser("tick", help="steady-state tick: upsert everything vs diff-aware write")
+    p_tick.add_argument("--rows", type=int, default=10_000)
+    p_tick.add_argument("--changed", type=float, default=0.01, help="fraction of rows with new content per tick")
+    p_tick.add_argument("--ticks", type=int, default=5)
+    p_rd = sub.add_parser("reads", help="handler-style reads: fresh connection per call vs pooled")
+    p_rd.add_argument("--rows", type=int, default=10_000)
+    p_rd.add_argument("--calls", type=int, default=2000)
+    p_sc = sub.add_parser("schema", help="per-call DDL vs one-time migrations")
+    p_sc.add_argument("--calls", type=int, default=2000)
+    p_pl = sub.add_parser("plans", help="EXPLAIN QUERY PLAN regression check for hot queries")
+    p_pl.add_argument("--rows", type=int, default=5000)
+    p_st = sub.add_parser("stress", help="p99 callback latency while a write tick runs")
+    p_st.add_argument("--rows", type=int, default=20_000)
+    p_st.add_argument("--clients", type=int, default=20)
+    p_st.add_argument("--period", type=float, default=0.05, help="seconds between taps per client")
+    p_ld = sub.add_parser("load", help="burst of concurrent callbacks: inline sqlite vs awaitable facade")
+    p_ld.add_argument("--rows", type=int, default=100_000)
+    p_ld.add_argument("--burst", type=int, default=200)
+    p_se = sub.add_parser("search", help="/search latency: LIKE scan vs FTS5 MATCH")
+    p_se.add_argument("--rows", type=int, default=100_000)
+    p_se.add_argument("--calls", type=int, default=200)
+    p_sc = sub.add_parser("search-check", help="/search rows on real snapshot cards show the card's own date")
+    p_sc.add_argument("--snapshot", default=str(pathlib.Path(__file__).resolve().parent / "last_snapshot.html"))
+    p_dt = sub.add_parser("dates", help="date-range + trip-length filter: per-row julianday() vs typed indexed columns")
+    p_dt.add_argument("--rows", type=int, default=100_000)
+    p_dt.add_argument("--calls", type=int, default=200)
+    p_rn = sub.add_parser("render", help="destination keyboard per tap: DB read + rebuild vs KeyboardCache")
+    p_rn.add_argument("--dests", type=int, default=300)
+    p_rn.add_argument("--taps", type=int, default=2000)
+    args = ap.parse_args()
+
+    if args.cmd == "upsert":
+        for r in bench_upsert(args.rows):
+            print(f"{r['rows']:>7d} rows | {r['path']:6s} {r['phase']:6s} | ins={r['inserted']:<7d} upd={r['updated']:<7d} "
+                  f"| {r['seconds']:7.3f}s | {r['rows_per_s']:>8d} rows/s")
+    elif args.cmd == "tick":
+        for r in bench_tick(args.rows, args.changed, args.ticks):
+            print(f"{r['rows']:>7d} rows | {r['path']:4s} | written={r['written']:<7d} "
+                  f"| best tick {r['seconds']:7.3f}s | wal after ticks {r['wal_mb']:.2f}MB")
+    elif args.cmd == "reads":
+        for r in bench_reads(args.rows, args.calls):
+            print(f"{r['rows']:>7d} rows | {r['path']:8s} | {r['calls']} calls | p50 {r['p50_ms']:.3f}ms | p99 {r['p99_ms']:.3f}ms")
+    elif args.cmd == "schema":
+        for r in bench_schema(args.calls):
+            print(f"{r['path']:13s} | {r['calls']} calls | {r['us_per_call']:8.1f} us/call")
+    elif args.cmd == "stress":
+        for r in bench_stress(args.rows, args.clients, args.period):
+            print(f"{r['mode']:9s} {'during tick' if r['tick'] else 'idle       '} ({r['tick_s']:5.2f}s) | "
+                  f"{r['callbacks']:5d} callbacks | p50 {r['p50_ms']:7.2f}ms | p99 {r['p99_ms']:7.2f}ms | max {r['max_ms']:7.2f}ms")
+    elif args.cmd == "load":
+        for r in bench_load(args.rows, args.burst):
+            print(f"{r['mode']:6s} | {r['burst']} callbacks | wall {r['wall_s']:6.3f}s | p50 {r['p50_ms']:8.2f}ms | "
+                  f"p99 {r['p99_ms']:8.2f}ms | max loop lag {r['max_loop_lag_ms']:7.1f}ms")
+    elif args.cmd == "search":
+        for r in bench_search(args.rows, args.calls):
+            print(f"{r['rows']:>7d} rows | {r['path']:4s} | {r['calls']} calls | hits {r['hit_ratio']:.2f} "
+                  f"| p50 {r['p50_ms']:8.3f}ms | p99 {r['p99_ms']:8.3f}ms")
+    elif args.cmd == "search-check":
+        sys.exit(1 if check_search(args.snapshot) else 0)
+    elif args.cmd == "dates":
+        for r in bench_dates(args.rows, args.calls):
+            print(f"{r['rows']:>7d} rows | {r['path']:9s} | {r['calls']} calls | p50 {r['p50_ms']:8.3f}ms | p99 {r['p99_ms']:8.3f}ms")
+    elif args.cmd == "render":
+        for r in bench_render(args.dests, args.taps):
+            print(f"{r['dests']:>5d} dests | {r['path']:7s} | {r['taps']} taps | p50 {r['p50_ms']:7.3f}ms | "
+                  f"p99 {r['p99_ms']:7.3f}ms | total {r['total_s']:6.3f}s")
+    elif args.cmd == "plans":
+        sys.exit(1 if check_plans(args.rows) else 0)
+
+if __name__ == "__main__":
+    main()
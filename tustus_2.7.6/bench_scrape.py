@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# bench_scrape.py — מדידת זמן פרסור לכרטיס show_item (אופליין, על snapshot שמור)
+from __future__ import annotations
+import argparse, asyncio, http.server, json, pathlib, tempfile, threading, time
+
+from bs4 import BeautifulSoup
+from lxml import etree
+
+import config
+import db
+import http_client
+import logic
+import snapshots
+
+ROOT = pathlib.Path(__file__).resolve().parent
+DEFAULT_SNAPSHOT = ROOT / "last_snapshot.html"
+
+def _best_of(fn, cards, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for c in cards:
+            fn(c)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def bench_per_card(html: str, repeat: int = 3) -> dict:
+    """_parse_item (soupsieve) מול _parse_card (plan מקומפל) על אותם כרטיסים."""
+    soup_cards = BeautifulSoup(html, "lxml").select(".show_item")
+    # עצים נפרדים לכל כרטיס, כדי ש-iter_cards לא ישחרר אותם
+    lxml_cards = [etree.fromstring(etree.tostring(el), etree.HTMLParser()).find(".//div")
+                  for el in logic.iter_cards(html)]
+    assert [logic._parse_item(c) for c in soup_cards] == [logic._parse_card(c) for c in lxml_cards]
+
+    n = len(soup_cards)
+    t_soup = _best_of(logic._parse_item, soup_cards, repeat)
+    t_plan = _best_of(logic._parse_card, lxml_cards, repeat)
+    return {
+        "cards": n,
+        "soup_us_per_card": round(t_soup / n * 1e6, 1),
+        "plan_us_per_card": round(t_plan / n * 1e6, 1),
+        "speedup": round(t_soup / t_plan, 1),
+    }
+
+# ---------- JSON == HTML ----------
+
+def check_json_parity(html: str) -> int:
+    """
+    rows_from_json על עותק JSON של הכרטיסים חייב להחזיר בדיוק את השורות של מסלול ה-HTML,
+    כולל העמודות המוקלדות (db.TYPED_SCHEDULE_COLS). ב-JSON רק out_date/back_date (ISO), כמו ב-API;
+    השאר מחושב מחדש. מחזיר מספר השורות השונות (0 = הכל בסדר).
+    """
+    items = logic.scrape_items(html, "stream")
+    derived = set(db.TYPED_SCHEDULE_COLS) - {"out_date", "back_date"}
+    payload = json.dumps({"items": [{k: v for k, v in it.items() if k not in derived} for it in items]})
+    rows = logic.rows_from_json(payload.encode("utf-8"))
+    bad = 0
+    for it, row in zip(items, rows):
+        diff = sorted(k for k in set(it) | set(row) if it.get(k) != row.get(k))
+        if diff:
+            bad += 1
+            if bad <= 3:
+                print(f"FAIL {it['item_id']}/{it['selapp_item']}: " + ", ".join(f"{k}: {it.get(k)!r} != {row.get(k)!r}" for k in diff))
+    typed = sum(all(r[c] is not None for c in ("out_date", "out_dep_min", "trip_days")) for r in rows)
+    if len(rows) != len(items) or not typed:
+        bad += 1
+    print(f"{'FAIL' if bad else 'ok  '} json rows {len(rows)}/{len(items)} | differing {bad} | typed dates parsed {typed}")
+    return bad
+
+# ---------- CardCache: fingerprint לא תלוי בחיתוך ה-chunks ----------
+
+def check_card_cache(html: str, chunk_sizes=(1000, 7919)) -> int:
+    """
+    אותו עמוד פעמיים, בחיתוך chunks שונה (כמו resp.iter_content): בסריקה השנייה אסור שיהיו
+    misses או כרטיסים "חדשים". מחזיר את מספרם (0 = הכל בסדר).
+    """
+    cache = logic.CardCache()
+    body = html.encode("utf-8")
+    bad = 0
+    for i, size in enumerate(chunk_sizes):
+        scan = cache.scan(body[j:j + size] for j in range(0, len(body), size))
+        scan.commit()
+        if i:
+            bad += scan.stats["miss"] + scan.stats["new"]
+        print(f"{'FAIL' if i and bad else 'ok  '} chunk {size:>5d}B | {scan.stats}")
+    return bad
+
+# ---------- Event-loop lag during a monitor tick ----------
+
+def _serve(body: bytes) -> http.server.HTTPServer:
+    # שרת מקומי שמגיש את ה-snapshot, כדי שהמדידה תרוץ אופליין
+    class _Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, *args):
+            pass
+    srv = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+async def _lag_during(tick, interval: float = 0.01) -> dict:
+    """מודד כמה באיחור מתעורר "handler" (sleep קצר) בזמן שהטיק רץ."""
+    lags = []
+    done = asyncio.Event()
+
+    async def _probe():
+        while not done.is_set():
+            t0 = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(time.perf_counter() - t0 - interval)
+
+    probe = asyncio.create_task(_probe())
+    await asyncio.sleep(0)  # נותן ל-probe להתחיל למדוד לפני הטיק
+    t0 = time.perf_counter()
+    await tick()
+    wall = time.perf_counter() - t0
+    done.set()
+    await probe
+    lags.sort()
+    return {
+        "tick_s": round(wall, 3),
+        "max_lag_ms": round(lags[-1] * 1000, 1),
+        "p99_lag_ms": round(lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000, 1),
+    }
+
+def bench_loop_lag(html: str) -> dict:
+    """
+    טיק מלא (DB בזיכרון, cache קר): monitor_job סינכרוני בתוך ה-loop מול run_monitor.
+    ה-snapshots של הטיק נכתבים לתיקייה זמנית; config.URL ו-SNAPSHOT_DIR חוזרים לערכם בסוף.
+    """
+    srv = _serve(html.encode("utf-8"))
+    tmp = tempfile.TemporaryDirectory(prefix="tustus_bench_scrape_")
+    saved = (config.URL, getattr(config, "SNAPSHOT_DIR", None), snapshots._STORE)
+    config.URL = f"http://127.0.0.1:{srv.server_address[1]}/"
+    config.SNAPSHOT_DIR = pathlib.Path(tmp.name)
+    snapshots._STORE = None  # get_store ייצור store חדש על התיקייה הזמנית
+
+    async def _sync_tick():
+        conn = db.get_conn(":memory:")
+        db.ensure_schema(conn)
+        logic.monitor_job(conn)  # כך רץ הטיק לפני ה-pipeline האסינכרוני
+        conn.close()
+
+    async def _async_tick():
+        writer = db.DbWriter(":memory:")
+        await writer.call(db.ensure_schema)
+        await logic.run_monitor(writer)
+        writer.close()
+        await http_client.close_client()
+
+    async def _run():
+        out = {}
+        for name, tick in (("sync", _sync_tick), ("async", _async_tick)):
+            logic._CARD_CACHE.clear()
+            out[name] = await _lag_during(tick)
+        return out
+
+    try:
+        return asyncio.run(_run())
+    finally:
+        srv.shutdown()
+        config.URL, config.SNAPSHOT_DIR, snapshots._STORE = saved
+        tmp.cleanup()
+
+def main():
+    ap = argparse.ArgumentParser(description="per-card parse benchmark")
+    ap.add_argument("snapshot", nargs="?", default=str(DEFAULT_SNAPSHOT))
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--loop-lag", action="store_true", help="measure event-loop lag during a full monitor tick")
+    ap.add_argument("--json-check", action="store_true", help="rows_from_json == HTML rows (incl. typed columns); exit 1 on mismatch")
+    ap.add_argument("--cache-check", action="store_true", help="CardCache: no misses when the same page arrives in different chunks")
+    args = ap.parse_args()
+    html = pathlib.Path(args.snapshot).read_text(encoding="utf-8")
+    if args.json_check:
+        raise SystemExit(1 if check_json_parity(html) else 0)
+    if args.cache_check:
+        raise SystemExit(1 if check_card_cache(html) else 0)
+    if args.loop_lag:
+        for name, r in bench_loop_lag(html).items():
+            print(f"{name:5s} | tick {r['tick_s']}s | handler lag max {r['max_lag_ms']}ms p99 {r['p99_lag_ms']}ms")
+        return
+    res = bench_per_card(html, args.repeat)
+    print(f"cards={res['cards']} | _parse_item {res['soup_us_per_card']}µs/card | "
+          f"_parse_card {res['plan_us_per_card']}µs/card | x{res['speedup']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# bench_suite.py — חבילת benchmark אופליין לפרסרים, על snapshots שמורים ודפים סינתטיים מוגדלים
+#
+#   python bench_suite.py                          # כל המקרים, תוצאות ל-bench_results.json (ליד הסקריפט)
+#   python bench_suite.py --scales 1 2 --targets stream v252
+#   python bench_suite.py --compare old.json       # השוואה מול ריצה קודמת (למשל מ-commit אחר)
+#
+# כל מקרה רץ בתהליך נפרד, כך ש-peak RSS נמדד לכל פרסר בנפרד ו-2.5.2 נטען עם ה-config שלו.
+from __future__ import annotations
+import argparse, json, os, pathlib, platform, re, resource, subprocess, sys, tempfile, time
+
+ROOT = pathlib.Path(__file__).resolve().parent
+OLD_DIR = ROOT.parent / "old" / "tusbot_v2.5.2"
+CORPUS = {
+    "snapshot_276": ROOT / "last_snapshot.html",
+    "snapshot_252": OLD_DIR / "_debug_tustus.html",
+}
+SYNTH_BASE = "snapshot_276"
+TARGETS = ("stream", "soup", "parallel", "v252")
+DEFAULT_TARGETS = ("stream", "soup", "v252")
+DEFAULT_SCALES = (1, 2, 5, 10)
+
+_CARD_START_RE = re.compile(r"""<div\b[^>]*\bclass\s*=\s*["'](?:[^"']*\s)?show_item(?:\s[^"']*)?["']""", re.IGNORECASE)
+
+_DIV_TAG_RE = re.compile(r"<div\b|</div\s*>", re.IGNORECASE)
+
+def _card_end(html: str, start: int) -> int:
+    # סוף ה-</div> שסוגר את הכרטיס שמתחיל ב-start (ספירת עומק של div)
+    depth = 0
+    for m in _DIV_TAG_RE.finditer(html, start):
+        depth += -1 if m.group().startswith("</") else 1
+        if not depth:
+            return m.end()
+    return len(html)
+
+def synthesize(html: str, scale: int) -> str:
+    """משכפל את בלוק כל הכרטיסים (מתחילת הראשון עד סוף האחרון) scale פעמים; ראש ו-footer כמו שהם."""
+    starts = [m.start() for m in _CARD_START_RE.finditer(html)]
+    if scale == 1 or not starts:
+        return html
+    first, end = starts[0], _card_end(html, starts[-1])
+    return html[:first] + html[first:end] * scale + html[end:]
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: KB
+
+def _child(target: str, path: str, repeat: int) -> dict:
+    # רץ בתהליך נפרד; מדפיס JSON אחד
+    if target == "v252":
+        sys.path.insert(0, str(OLD_DIR))
+        import logic as old_logic  # noqa: E402  (logic של 2.5.2)
+        run = lambda h: old_logic._parse_show_items_from_html(h, old_logic.cfg.URL)
+    else:
+        sys.path.insert(0, str(ROOT))
+        import logic  # noqa: E402
+        run = lambda h: logic.scrape_items(h, target)
+    html = pathlib.Path(path).read_text(encoding="utf-8")
+    base_rss = _rss_mb()
+    best, n = float("inf"), 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        n = len(run(html))
+        best = min(best, time.perf_counter() - t0)
+    peak = _rss_mb()
+    return {
+        "cards": n,
+        "wall_s": round(best, 3),
+        "cards_per_s": round(n / best, 1) if best else None,
+        "peak_rss_mb": round(peak, 1),
+        "rss_delta_mb": round(peak - base_rss, 1),
+    }
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return ""
+
+def run_suite(targets, scales, repeat: int) -> dict:
+    results = []
+    with tempfile.TemporaryDirectory(prefix="tustus_bench_") as tmp:
+        cases = [(name, 1, path) for name, path in CORPUS.items() if path.exists()]
+        base = CORPUS[SYNTH_BASE].read_text(encoding="utf-8")
+        for scale in scales:
+            if scale == 1:
+                continue
+            p = pathlib.Path(tmp) / f"synthetic_x{scale}.html"
+            p.write_text(synthesize(base, scale), encoding="utf-8")
+            cases.append((f"synthetic_x{scale}", scale, p))
+        if 1 not in scales:
+            cases = [c for c in cases if c[1] != 1]
+
+        for corpus, scale, path in cases:
+            size_mb = round(path.stat().st_size / 2**20, 2)
+            for target in targets:
+                out = subprocess.run(
+                    [sys.executable, __file__, "--child", target, str(path), "--repeat", str(repeat)],
+                    cwd=tmp, capture_output=True, text=True,
+                )
+                if out.returncode != 0:
+                    res = {"error": out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "failed"}
+                else:
+                    res = json.loads(out.stdout.strip().splitlines()[-1])
+                res.update({"corpus": corpus, "scale": scale, "size_mb": size_mb, "target": target})
+                results.append(res)
+                print(_fmt(res), flush=True)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "repeat": repeat,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+def _fmt(r: dict) -> str:
+    head = f"{r['corpus']:14s} {r['size_mb']:6.2f}MB {r['target']:8s}"
+    if "error" in r:
+        return f"{head} ERROR {r['error']}"
+    return (f"{head} {r['cards']:6d} cards  {r['wall_s']:7.3f}s  {r['cards_per_s']:9.1f} cards/s  "
+            f"peak {r['peak_rss_mb']:7.1f}MB (+{r['rss_delta_mb']:.1f})")
+
+def compare(old: dict, new: dict) -> None:
+    """יחס זמן/זיכרון לכל (corpus, target) בין שתי ריצות; >1 = איטי/כבד יותר מהקודם."""
+    prev = {(r["corpus"], r["target"]): r for r in old.get("results", []) if "error" not in r}
+    print(f"\ncompare: {old['meta'].get('commit') or '?'} -> {new['meta'].get('commit') or '?'}")
+    for r in new["results"]:
+        p = prev.get((r["corpus"], r["target"]))
+        if not p or "error" in r:
+            continue
+        print(f"{r['corpus']:14s} {r['target']:8s} wall x{r['wall_s'] / p['wall_s']:.2f}  "
+              f"rss_delta {p['rss_delta_mb']:.1f} -> {r['rss_delta_mb']:.1f}MB")
+
+def main():
+    ap = argparse.ArgumentParser(description="offline scraper benchmark suite")
+    ap.add_argument("--targets", nargs="+", choices=TARGETS, default=list(DEFAULT_TARGETS))
+    ap.add_argument("--scales", nargs="+", type=int, default=list(DEFAULT_SCALES))
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--out", default=str(ROOT / "bench_results.json"))
+    ap.add_argument("--compare", help="previous results JSON to compare against")
+    ap.add_argument("--child", nargs=2, metavar=("TARGET", "HTML"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(_child(args.child[0], args.child[1], args.repeat)))
+        return
+
+    report = run_suite(args.targets, args.scales, args.repeat)
+    pathlib.Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"results -> {pathlib.Path(args.out).resolve()}")
+    if args.compare:
+        compare(json.loads(pathlib.Path(args.compare).read_text(encoding="utf-8")), report)
+
+if __name__ == "__main__":
+    main()
@@ -29,20 +29,75 @@ BOT_TOKEN = os.getenv("BOT_TOKEN", "8355167350:AAFHXoKgOR7Ja0NOncn2_9PY0hp3Kn4tN
 
 # ===== Scraper Source =====
 URL = "https://www.tustus.co.il/Arkia/Home"
+# endpoint JSON של דילים (למשל ממה ש-debug_scrape_once מצא). ריק = רק HTML.
+# אם ה-JSON חסר או פגום, הטיק נופל אוטומטית ל-HTML.
+DEALS_JSON_URL = ""
 
 # ===== Scraper Tuning =====
 REQUEST_TIMEOUT = 15  # שניות
+# לקוח ה-HTTP של הסורק (http_client.py): timeouts נפרדים להתחברות ולקריאה, pool ו-keep-alive
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 20
+HTTP_POOL_SIZE = 4
+HTTP_KEEPALIVE = 75   # שניות שחיבור פנוי נשאר פתוח
+HTTP_DNS_TTL = 300    # cache של DNS (שניות)
 USER_AGENT = (
     "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
     "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
 )
 
+# מצב פרסור הדף: "stream" (lxml הדרגתי, כרטיס אחד בזיכרון), "parallel" (תהליכים) או "soup" (עץ BeautifulSoup מלא)
+SCRAPE_MODE = "stream"
+# מספר תהליכי פרסור במצב "parallel" (1 = בתוך התהליך)
+PARSE_WORKERS = 4
+# cache ברמת כרטיס: רק כרטיסים שה-HTML שלהם השתנה עוברים פרסור ו-upsert.
+# גם כשהוא פעיל SCRAPE_MODE קובע איך מפורסרים הכרטיסים שלא ב-cache (CardCache.scan)
+CARD_CACHE = True
+
+# ארכיון snapshots של הדף (snapshots.py): כל דף שונה נשמר דחוס פעם אחת, לפי hash
+SNAPSHOTS_ENABLED = True
+SNAPSHOT_DIR = DATA_DIR / "snapshots"
+SNAPSHOT_RETENTION_DAYS = 7
+SNAPSHOT_MAX_COUNT = 5000
+
+# חיבורי SQLite (db.ConnectionManager): writer אחד + pool קריאה
+DB_READERS = 4
+DB_CACHE_SIZE_KB = 16384          # PRAGMA cache_size לכל חיבור
+DB_MMAP_SIZE = 256 * 2**20        # PRAGMA mmap_size
+DB_CACHED_STATEMENTS = 256        # cache של statements מוכנים בכל חיבור
+DB_POOL_TIMEOUT = 10              # שניות המתנה לחיבור קריאה פנוי
+DB_WRITE_BATCH = 500              # שורות לטרנזקציה בכתיבת טיק (טרנזקציות קצרות)
+SEARCH_LIMIT = 10                 # תוצאות ל-/search
+RENDER_CACHE_SIZE = 64            # מקלדות יעדים מוכנות ב-cache (LRU לפי "selected")
+
+# היסטוריית מחירים/זמינות (טבלת flight_history): שורה לכל שינוי, ודילול יומי של מה שישן
+HISTORY_ENABLED = True
+HISTORY_KEEP_FULL_DAYS = 30      # עד כאן נשמר כל שינוי; מעבר לזה שורה אחת ל-bucket
+HISTORY_BUCKET_HOURS = 24
+
+# תחזוקה יומית (maintenance.py): ארכיון, דילול היסטוריה, checkpoint ל-WAL, incremental vacuum
+MAINTENANCE_AT = "01:30"         # HH:MM, UTC (ברירת המחדל של job_queue) — שעה שקטה באתר
+ARCHIVE_AFTER_DAYS = 14          # שורה שלא נראתה כך וכך ימים עוברת ל-flights_archive (0 = כבוי)
+MAINT_VACUUM_PAGES = 0           # דפים לשחרר בכל סבב (0 = כל הדפים הפנויים)
+
+# ייצוא Parquet לאנליטיקה (export.py, דורש pyarrow)
+EXPORT_DIR = DATA_DIR / "export"
+EXPORT_BATCH = 5000              # שורות לכל fetchmany / record batch
+EXPORT_LAG_S = 5                 # החלון נגמר כמה שניות לפני "עכשיו" — לא חותכים באמצע שנייה של כתיבה
+
 # "חלון חדש" לטיסות — כמה שעות אחורה נחשבות "חדשות"
 NEW_WINDOW_HOURS = 24
 
 # ===== Monitor / Scheduler =====
-# מרווח בין סריקות (שניות)
+# מרווח התחלתי בין סריקות (שניות); המרווח בפועל אדפטיבי (scheduler.py)
 INTERVAL = 60
+# גבולות המרווח: מתקצר עד MIN כשהדף משתנה, מתארך עד MAX כשהוא סטטי
+MONITOR_MIN_INTERVAL = 20
+MONITOR_MAX_INTERVAL = 300
+# jitter יחסי (±10%) כדי לא לפגוע באתר בדיוק באותה שנייה
+MONITOR_JITTER = 0.1
+# תקרת backoff אקספוננציאלי אחרי שגיאות HTTP רצופות (שניות)
+MONITOR_BACKOFF_MAX = 900
 # אם True, תצוגת המוניטור תראה "⏱  פעילה" כברירת מחדל
 MONITOR_QUIET_ACTIVE_TIME = True
 
@@ -1,74 +1,532 @@
 # db.py
 from __future__ import annotations
+import asyncio
+import contextlib
+import json
+import logging
+import queue
+import re
 import sqlite3
-from typing import Optional
+import textwrap
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
 import time
 import config
 
+log = logging.getLogger("tustus.db")
+
+def _tune(conn: sqlite3.Connection) -> sqlite3.Connection:
+    # PRAGMAs פר-חיבור (לא נשמרים בקובץ): cache דפים, mmap, טבלאות זמניות בזיכרון
+    conn.execute(f"PRAGMA cache_size=-{int(getattr(config, 'DB_CACHE_SIZE_KB', 16384))}")
+    conn.execute(f"PRAGMA mmap_size={int(getattr(config, 'DB_MMAP_SIZE', 256 * 2**20))}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA synchronous=NORMAL")  # מספיק ב-WAL
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
 def get_conn(path: Optional[str] = None) -> sqlite3.Connection:
     db_path = path or config.DB_PATH
-    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn = sqlite3.connect(db_path, check_same_thread=False,
+                           cached_statements=getattr(config, "DB_CACHED_STATEMENTS", 256))
     conn.row_factory = sqlite3.Row
-    return conn
+    return _tune(conn)
+
+class DbWriter:
+    """
+    thread כתיבה ייעודי עם חיבור משלו. המוניטור מריץ דרכו את כל עבודת ה-DB,
+    כך שה-event loop של הבוט לא מחכה ל-I/O של הדיסק.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self._path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+
+    def _run(self, fn, args):
+        if self._conn is None:
+            self._conn = get_conn(self._path)
+        return fn(self._conn, *args)
+
+    async def call(self, fn, *args):
+        # fn(conn, *args) רץ ב-thread הכתיבה
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._run, fn, args)
+
+    def close(self) -> None:
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self._executor.submit(_close).result()
+        self._executor.shutdown()
+
+class ConnectionManager:
+    """
+    מודל הגישה ל-DB:
+    - writer אחד (DbWriter, thread משלו) — רק המוניטור והתחזוקה כותבים, בטרנזקציות קצרות.
+    - pool של חיבורי קריאה עם query_only=ON. handlers קוראים דרך `await manager.read(fn, ...)`,
+      שרץ ב-thread pool משלו — ה-event loop לא נוגע בדיסק, וב-WAL קורא לא ממתין לכותב
+      (רואה את ה-commit האחרון שלפני תחילת השאילתה).
+    - `with manager.reader() as conn:` לקוד סינכרוני (כלים, סקריפטים).
+    """
+    def __init__(self, path: Optional[str] = None, readers: Optional[int] = None):
+        self.path = str(path or config.DB_PATH)
+        self.size = int(readers or getattr(config, "DB_READERS", 4))
+        self.writer = DbWriter(self.path)
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._read_executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="db-read")
+
+    def _open_reader(self) -> sqlite3.Connection:
+        conn = get_conn(self.path)
+        conn.execute("PRAGMA query_only=ON")  # קורא לא יכול לכתוב בטעות ולהתחרות ב-writer
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("connection manager is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                return self._open_reader()
+        return self._idle.get(timeout=getattr(config, "DB_POOL_TIMEOUT", 10))
+
+    @contextlib.contextmanager
+    def reader(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def _read(self, fn, args):
+        with self.reader() as conn:
+            return fn(conn, *args)
+
+    async def read(self, fn, *args):
+        # fn(conn, *args) על חיבור קריאה, ב-thread pool של הקוראים
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, self._read, fn, args)
+
+    def close(self) -> None:
+        self._closed = True
+        self._read_executor.shutdown(wait=True)
+        self.writer.close()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._opened = 0
+
+_MANAGER: Optional[ConnectionManager] = None
+
+def open_manager(path: Optional[str] = None, readers: Optional[int] = None) -> ConnectionManager:
+    """נקרא פעם אחת בעליית ה-Application (post_init)."""
+    global _MANAGER
+    if _MANAGER is None:
+        _MANAGER = ConnectionManager(path, readers)
+    return _MANAGER
+
+def get_manager() -> ConnectionManager:
+    # כלים/סקריפטים שלא עברו דרך app.py מקבלים manager על config.DB_PATH
+    return _MANAGER or open_manager()
+
+def reader():
+    """`with db.reader() as conn:` — חיבור קריאה מה-pool."""
+    return get_manager().reader()
+
+async def read(fn, *args):
+    """`await db.read(fn, ...)` — fn(conn, ...) על חיבור קריאה, מחוץ ל-event loop."""
+    return await get_manager().read(fn, *args)
+
+def close_manager() -> None:
+    # post_shutdown
+    global _MANAGER
+    if _MANAGER is not None:
+        _MANAGER.close()
+        _MANAGER = None
+
+# ---------- לו"ז מוקלד: תאריכי ISO, דקות epoch, אורך טיול ----------
+#
+# בכרטיס התאריך הוא "יום ב' 01/09" (בלי שנה) והשעה "06:45" בשעון המקומי שמוצג באתר. המפענח
+# ממיר אותם לעמודות שאפשר לאנדקס ולסנן בטווח; השנה נבחרת ביחס ליום הסריקה (ref).
+# *_dep_min = דקות מ-1970-01-01 00:00 לפי השעון המוצג (בלי אזור זמן) — למיון ולטווחים, לא לחישובי UTC.
+
+TYPED_SCHEDULE_COLS = ["out_date", "back_date", "out_dep_min", "back_dep_min",
+                       "trip_days", "out_duration_min", "back_duration_min"]
+
+_DAY_MONTH_RE = re.compile(r"(\d{1,2})/(\d{1,2})(?:/(\d{4}|\d{2}))?")
+_HHMM_RE = re.compile(r"(\d{1,2}):(\d{1,2})")
+_EPOCH_DAY = date(1970, 1, 1)
+_PAST_GRACE_DAYS = 30  # dd/mm שעבר לפני יותר מזה = השנה הבאה
+
+def parse_day_month(text: Optional[str], ref: date, not_before: Optional[date] = None) -> Optional[date]:
+    """"יום ב' 01/09" -> date. בלי שנה: התאריך הראשון שאינו לפני not_before (או ref פחות 30 יום)."""
+    m = _DAY_MONTH_RE.search(text or "")
+    if not m:
+        return None
+    day, month = int(m.group(1)), int(m.group(2))
+    if m.group(3):
+        year = int(m.group(3))
+        try:
+            return date(year + 2000 if year < 100 else year, month, day)
+        except ValueError:
+            return None
+    floor = not_before or ref - timedelta(days=_PAST_GRACE_DAYS)
+    for year in (floor.year, floor.year + 1):
+        try:
+            d = date(year, month, day)
+        except ValueError:
+            continue
+        if d >= floor:
+            return d
+    return None
+
+def parse_minutes(text: Optional[str], clock: bool = False) -> Optional[int]:
+    """"2:10" -> 130. clock=True: שעה ביום (עד 23:59)."""
+    m = _HHMM_RE.search(text or "")
+    if not m:
+        return None
+    h, mi = int(m.group(1)), int(m.group(2))
+    if mi > 59 or (clock and h > 23):
+        return None
+    return h * 60 + mi
+
+def typed_schedule(out_date_text: Optional[str], out_time: Optional[str],
+                   back_date_text: Optional[str], back_time: Optional[str],
+                   out_duration: Optional[str], back_duration: Optional[str],
+                   ref: Optional[date] = None) -> Dict[str, object]:
+    """עמודות TYPED_SCHEDULE_COLS מהטקסט של הכרטיס; שדה שלא פוענח = None."""
+    ref = ref or date.today()
+    out_d = parse_day_month(out_date_text, ref)
+    back_d = parse_day_month(back_date_text, ref, not_before=out_d)
+    out_t = parse_minutes(out_time, clock=True)
+    back_t = parse_minutes(back_time, clock=True)
+    return {
+        "out_date": out_d.isoformat() if out_d else None,
+        "back_date": back_d.isoformat() if back_d else None,
+        "out_dep_min": (out_d - _EPOCH_DAY).days * 1440 + out_t if out_d and out_t is not None else None,
+        "back_dep_min": (back_d - _EPOCH_DAY).days * 1440 + back_t if back_d and back_t is not None else None,
+        "trip_days": (back_d - out_d).days + 1 if out_d and back_d else None,  # כמו ב-2.5.2: כולל שני הימים
+        "out_duration_min": parse_minutes(out_duration),
+        "back_duration_min": parse_minutes(back_duration),
+    }
+
+# מפתחות scrape_state שבזכותם טיק מדלג על עמוד/JSON שלא השתנה (logic._fetch / _write_tick)
+_SOURCE_STATE_KEYS = [f"{source}_{k}" for source in ("page", "json") for k in ("hash", "etag", "last_modified")]
+
+def _backfill_typed_schedule(conn: sqlite3.Connection) -> None:
+    # ממלא את העמודות המוקלדות מהטקסט השמור. בחזור back_from_date כולל את התאריך, אבל בהלוך
+    # out_from_date הוא רק שם העיר (ראה logic._parse_card) וטקסט התאריך לא נשמר באף עמודה —
+    # אין ממה לשחזר out_date/out_dep_min/trip_days. לכן מוחקים את ה-hash וה-validators של המקורות:
+    # הטיק הבא מוריד ומפענח את העמוד מחדש גם אם לא השתנה, וה-hash של כל שורה (עם העמודות
+    # המוקלדות) שונה מהשמור, כך שכל שורה שעדיין באתר נכתבת מחדש עם הערכים מהמפענח.
+    rows = conn.execute(
+        "SELECT id, out_from_date, out_from_time, back_from_date, back_from_time, out_duration, back_duration, "
+        "date(COALESCE(created_at, CURRENT_TIMESTAMP)) FROM flights"
+    ).fetchall()
+    sets = ",".join(f"{c}=?" for c in TYPED_SCHEDULE_COLS)
+    conn.executemany(f"UPDATE flights SET {sets} WHERE id=?", (
+        [*typed_schedule(*tuple(r)[1:7], ref=date.fromisoformat(r[7])).values(), r[0]] for r in rows
+    ))
+    conn.execute(f"DELETE FROM scrape_state WHERE key IN ({','.join('?' * len(_SOURCE_STATE_KEYS))})",
+                 _SOURCE_STATE_KEYS)
+
+# ---------- סכימה: migrations לפי PRAGMA user_version ----------
+#
+# כל migration רצה פעם אחת; כל החסרות רצות יחד בטרנזקציה אחת עם עדכון user_version.
+# בעלייה (app._ensure_db) migrate() מביא את הקובץ לגרסה האחרונה; אחרי זה אין DDL בשום נתיב חם.
+# migration חדשה = רשומה חדשה בסוף הרשימה (לא לערוך רשומה שכבר שוחררה).
+# schema.sql נוצר מהרשימה: python db.py schema > schema.sql
+
+MIGRATIONS: List[Tuple[int, str, object]] = [
+    (1, "flights + scrape_state", """
+    CREATE TABLE IF NOT EXISTS flights (
+        id INTEGER PRIMARY KEY,
+        item_id TEXT,
+        selapp_item TEXT,
+        category TEXT,
+        provider TEXT,
+        affiliation TEXT,
+        promo_category TEXT,
+        destination TEXT,
+        dest_city TEXT,
+        dest_country TEXT,
+        trip_title TEXT,
+        price REAL,
+        currency TEXT,
+        price_text TEXT,
+        img_url TEXT,
+        badge_text TEXT,
+
+        out_from_city TEXT,
+        out_from_date TEXT,
+        out_from_time TEXT,
+        out_to_city   TEXT,
+        out_to_date   TEXT,
+        out_to_time   TEXT,
+        out_duration  TEXT,
+
+        back_from_city TEXT,
+        back_from_date TEXT,
+        back_from_time TEXT,
+        back_to_city   TEXT,
+        back_to_date   TEXT,
+        back_to_time   TEXT,
+        back_duration  TEXT,
+
+        note TEXT,
+        more_like TEXT,
+        url  TEXT,
+
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_seen  TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+        UNIQUE(item_id, selapp_item)
+    );
+
+    CREATE INDEX IF NOT EXISTS ix_flights_city_country ON flights(dest_country, dest_city);
+    CREATE INDEX IF NOT EXISTS ix_flights_last_seen    ON flights(last_seen);
+    CREATE INDEX IF NOT EXISTS ix_flights_price        ON flights(price);
+
+    -- מצב הסורק בין ריצות (hash אחרון, ETag/Last-Modified, זמן טיק)
+    CREATE TABLE IF NOT EXISTS scrape_state (
+        key   TEXT PRIMARY KEY,
+        value TEXT
+    );
+    """),
+    (2, "flight_history", """
+    -- היסטוריית שינויים append-only: שורה לכל שינוי תוכן של טיסה (ראה record_history)
+    CREATE TABLE IF NOT EXISTS flight_history (
+        flight_id   INTEGER NOT NULL,   -- flights.id
+        ts          INTEGER NOT NULL,   -- epoch seconds
+        changed     INTEGER NOT NULL,   -- ביטים: HIST_PRICE | HIST_CURRENCY | HIST_BADGE | HIST_SCHEDULE
+        price       REAL,               -- תמיד: המחיר אחרי השינוי
+        price_delta REAL,               -- רק כשהמחיר השתנה (שלילי = ירידה)
+        currency    TEXT,               -- שאר השדות רק כשהם השתנו, אחרת NULL
+        badge_text  TEXT,
+        schedule    TEXT,
+        PRIMARY KEY (flight_id, ts)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS ix_history_drops ON flight_history(ts) WHERE price_delta < 0;
+    """),
+    (3, "normalized destination keys", """
+    -- מפתחות יעד מנורמלים, נכתבים ב-upsert (dest_keys); עמודות רגילות ולא generated,
+    -- כי SQLite לא מחשיב אינדקס על עמודה generated כ-covering
+    ALTER TABLE flights ADD COLUMN dest_city_key TEXT;
+    ALTER TABLE flights ADD COLUMN dest_country_key TEXT;
+    UPDATE flights SET
+        dest_city_key = COALESCE(NULLIF(TRIM(dest_city), ''), NULLIF(TRIM(destination), ''), 'יעד לא ידוע'),
+        dest_country_key = COALESCE(TRIM(dest_country), '');
+    DROP INDEX IF EXISTS ix_flights_city_country;
+    CREATE INDEX IF NOT EXISTS ix_flights_dest_key ON flights(dest_country_key, dest_city_key, dest_city);
+    """),
+    (4, "dest_stats", """
+    -- אגרגט יעדים ממומש: שורה לכל (מדינה, עיר), מתוחזק ע"י triggers על flights.
+    -- המקלדת והסיכום קוראים מכאן ב-O(יעדים), בלי GROUP BY על כל הטבלה
+    CREATE TABLE IF NOT EXISTS dest_stats (
+        country     TEXT NOT NULL,      -- dest_country_key
+        city        TEXT NOT NULL,      -- dest_city_key
+        destination TEXT,               -- תווית לתצוגה (destination של השורה האחרונה שנכתבה)
+        cnt         INTEGER NOT NULL DEFAULT 0,
+        min_price   REAL,
+        last_seen   TIMESTAMP,
+        PRIMARY KEY (country, city)
+    ) WITHOUT ROWID;
+
+    INSERT OR REPLACE INTO dest_stats(country, city, destination, cnt, min_price, last_seen)
+    SELECT COALESCE(dest_country_key, ''), COALESCE(dest_city_key, 'יעד לא ידוע'),
+           MAX(destination), COUNT(*), MIN(price), MAX(last_seen)
+    FROM flights GROUP BY 1, 2;
+
+    CREATE TRIGGER IF NOT EXISTS trg_dest_stats_ins AFTER INSERT ON flights BEGIN
+        INSERT INTO dest_stats(country, city, destination, cnt, min_price, last_seen)
+        VALUES (COALESCE(NEW.dest_country_key, ''), COALESCE(NEW.dest_city_key, 'יעד לא ידוע'),
+                NEW.destination, 1, NEW.price, NEW.last_seen)
+        ON CONFLICT(country, city) DO UPDATE SET
+            cnt = cnt + 1,
+            destination = excluded.destination,
+            min_price = MIN(COALESCE(min_price, excluded.min_price), COALESCE(excluded.min_price, min_price)),
+            last_seen = MAX(COALESCE(last_seen, ''), COALESCE(excluded.last_seen, ''));
+    END;
+
+    -- AFTER: ה-MIN מחושב מחדש בלי השורה שנמחקה, ורק כשהיא הייתה המינימום
+    CREATE TRIGGER IF NOT EXISTS trg_dest_stats_del AFTER DELETE ON flights BEGIN
+        UPDATE dest_stats SET
+            cnt = cnt - 1,
+            min_price = CASE WHEN OLD.price <= min_price THEN
+                (SELECT MIN(price) FROM flights
+                 WHERE dest_country_key = OLD.dest_country_key AND dest_city_key = OLD.dest_city_key)
+                ELSE min_price END
+        WHERE country = COALESCE(OLD.dest_country_key, '') AND city = COALESCE(OLD.dest_city_key, 'יעד לא ידוע');
+        DELETE FROM dest_stats
+        WHERE country = COALESCE(OLD.dest_country_key, '') AND city = COALESCE(OLD.dest_city_key, 'יעד לא ידוע')
+          AND cnt <= 0;
+    END;
+
+    -- שינוי יעד/מחיר: יציאה מהיעד הישן (כמו delete) וכניסה לחדש (כמו insert)
+    CREATE TRIGGER IF NOT EXISTS trg_dest_stats_upd AFTER UPDATE OF dest_country_key, dest_city_key, price ON flights
+    WHEN OLD.dest_country_key IS NOT NEW.dest_country_key OR OLD.dest_city_key IS NOT NEW.dest_city_key
+         OR OLD.price IS NOT NEW.price
+    BEGIN
+        UPDATE dest_stats SET
+            cnt = cnt - 1,
+            min_price = CASE WHEN OLD.price <= min_price THEN
+                (SELECT MIN(price) FROM flights
+                 WHERE dest_country_key = OLD.dest_country_key AND dest_city_key = OLD.dest_city_key
+                   AND id <> NEW.id)
+                ELSE min_price END
+        WHERE country = COALESCE(OLD.dest_country_key, '') AND city = COALESCE(OLD.dest_city_key, 'יעד לא ידוע');
+        DELETE FROM dest_stats
+        WHERE country = COALESCE(OLD.dest_country_key, '') AND city = COALESCE(OLD.dest_city_key, 'יעד לא ידוע')
+          AND cnt <= 0;
+        INSERT INTO dest_stats(country, city, destination, cnt, min_price, last_seen)
+        VALUES (COALESCE(NEW.dest_country_key, ''), COALESCE(NEW.dest_city_key, 'יעד לא ידוע'),
+                NEW.destination, 1, NEW.price, NEW.last_seen)
+        ON CONFLICT(country, city) DO UPDATE SET
+            cnt = cnt + 1,
+            destination = excluded.destination,
+            min_price = MIN(COALESCE(min_price, excluded.min_price), COALESCE(excluded.min_price, min_price)),
+            last_seen = MAX(COALESCE(last_seen, ''), COALESCE(excluded.last_seen, ''));
+    END;
+
+    -- last_seen של היעד לא מתוחזק ב-trigger (היה רץ על כל שורה בכל טיק) — ראה bump_dest_seen
+    """),
+    (5, "flights_archive", """
+    -- שורות שלא נראו ARCHIVE_AFTER_DAYS ימים עוברות לכאן (maintenance.archive_stale),
+    -- כך ש-flights נשארת בגודל של מה שבאמת באתר. id נשמר (flight_history מפנה אליו)
+    CREATE TABLE IF NOT EXISTS flights_archive AS SELECT * FROM flights WHERE 0;
+    ALTER TABLE flights_archive ADD COLUMN archived_at TIMESTAMP;
+    CREATE INDEX IF NOT EXISTS ix_archive_key ON flights_archive(item_id, selapp_item);
+    """),
+    (6, "flights_fts", """
+    -- חיפוש טקסט חופשי (/search): FTS5 עם external content על flights — הטקסט לא משוכפל,
+    -- רק האינדקס. unicode61 מפרק עברית ואנגלית ומסיר ניקוד; prefix מאיץ "אתו*".
+    -- flights_archive לא מאונדקס: /search מחפש רק בטיסות שעדיין באתר
+    CREATE VIRTUAL TABLE IF NOT EXISTS flights_fts USING fts5(
+        destination, dest_city, dest_country, trip_title, note,
+        content='flights', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    );
+    INSERT INTO flights_fts(flights_fts) VALUES('rebuild');
+
+    CREATE TRIGGER IF NOT EXISTS trg_fts_ins AFTER INSERT ON flights BEGIN
+        INSERT INTO flights_fts(rowid, destination, dest_city, dest_country, trip_title, note)
+        VALUES (NEW.id, NEW.destination, NEW.dest_city, NEW.dest_country, NEW.trip_title, NEW.note);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_fts_del AFTER DELETE ON flights BEGIN
+        INSERT INTO flights_fts(flights_fts, rowid, destination, dest_city, dest_country, trip_title, note)
+        VALUES ('delete', OLD.id, OLD.destination, OLD.dest_city, OLD.dest_country, OLD.trip_title, OLD.note);
+    END;
+    -- ה-upsert כותב את כל העמודות; האינדקס מתעדכן רק כשאחד מהשדות המאונדקסים באמת השתנה
+    CREATE TRIGGER IF NOT EXISTS trg_fts_upd AFTER UPDATE OF destination, dest_city, dest_country, trip_title, note ON flights
+    WHEN OLD.destination IS NOT NEW.destination OR OLD.dest_city IS NOT NEW.dest_city
+         OR OLD.dest_country IS NOT NEW.dest_country OR OLD.trip_title IS NOT NEW.trip_title
+         OR OLD.note IS NOT NEW.note
+    BEGIN
+        INSERT INTO flights_fts(flights_fts, rowid, destination, dest_city, dest_country, trip_title, note)
+        VALUES ('delete', OLD.id, OLD.destination, OLD.dest_city, OLD.dest_country, OLD.trip_title, OLD.note);
+        INSERT INTO flights_fts(rowid, destination, dest_city, dest_country, trip_title, note)
+        VALUES (NEW.id, NEW.destination, NEW.dest_city, NEW.dest_country, NEW.trip_title, NEW.note);
+    END;
+    """),
+    (7, "typed schedule columns", """
+    -- לו"ז מוקלד (TYPED_SCHEDULE_COLS), נכתב ע"י המפענח. סינון לפי טווח תאריכים / אורך טיול
+    -- הוא סריקת טווח על אינדקס, במקום julianday() על כל שורה
+    ALTER TABLE flights ADD COLUMN out_date DATE;
+    ALTER TABLE flights ADD COLUMN back_date DATE;
+    ALTER TABLE flights ADD COLUMN out_dep_min INTEGER;
+    ALTER TABLE flights ADD COLUMN back_dep_min INTEGER;
+    ALTER TABLE flights ADD COLUMN trip_days INTEGER;
+    ALTER TABLE flights ADD COLUMN out_duration_min INTEGER;
+    ALTER TABLE flights ADD COLUMN back_duration_min INTEGER;
+    ALTER TABLE flights_archive ADD COLUMN out_date DATE;
+    ALTER TABLE flights_archive ADD COLUMN back_date DATE;
+    ALTER TABLE flights_archive ADD COLUMN out_dep_min INTEGER;
+    ALTER TABLE flights_archive ADD COLUMN back_dep_min INTEGER;
+    ALTER TABLE flights_archive ADD COLUMN trip_days INTEGER;
+    ALTER TABLE flights_archive ADD COLUMN out_duration_min INTEGER;
+    ALTER TABLE flights_archive ADD COLUMN back_duration_min INTEGER;
+    CREATE INDEX IF NOT EXISTS ix_flights_out_dep ON flights(out_dep_min);
+    CREATE INDEX IF NOT EXISTS ix_flights_trip_dep ON flights(trip_days, out_dep_min);
+    CREATE INDEX IF NOT EXISTS ix_flights_dest_dep ON flights(dest_country_key, dest_city_key, out_dep_min);
+    """),
+    (8, "backfill typed schedule", _backfill_typed_schedule),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def _statements(script: str) -> Iterable[str]:
+    # מפצל SQL למשפטים שלמים (גם CREATE TRIGGER ... BEGIN ...; END), כדי להריץ אותם בלי executescript,
+    # שעושה COMMIT לפני שהוא מתחיל
+    buf = ""
+    for line in textwrap.dedent(script).splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            yield buf
+            buf = ""
+    if buf.strip():
+        yield buf  # הערות בסוף; SQL לא שלם ייכשל ב-execute
+
+def migrate(conn: sqlite3.Connection) -> Tuple[int, int]:
+    """
+    מריץ את ה-migrations החסרות לפי הסדר. migration היא SQL או fn(conn).
+    כולן בטרנזקציה אחת (DDL ב-SQLite טרנזקציוני): קובץ שהסכימה שלו לא תואמת נכשל בלי לשנות
+    כלום, עם RuntimeError שמציין איזו migration נכשלה ולמה — לא נתקע באמצע בגרסה חלקית.
+    קובץ שכבר בגרסה האחרונה = PRAGMA אחד ויציאה. מחזיר (גרסה לפני, גרסה אחרי).
+    """
+    start = schema_version(conn)
+    if start >= SCHEMA_VERSION:
+        return start, start
+    conn.execute("PRAGMA journal_mode=WAL")  # נשמר בקובץ; מחוץ לטרנזקציה
+    pending = [(v, name, step) for v, name, step in MIGRATIONS if v > start]
+    conn.execute("BEGIN")
+    try:
+        for version, name, step in pending:
+            try:
+                if callable(step):
+                    step(conn)
+                else:
+                    for stmt in _statements(step):
+                        conn.execute(stmt)
+            except sqlite3.Error as e:
+                raise RuntimeError(f"schema migration v{version} ({name}) failed: {e} — the existing tables "
+                                   f"don't match the expected schema; rolled back, the file is still at v{start}") from e
+        conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        log.exception("schema migration v%d -> v%d failed, rolled back", start, SCHEMA_VERSION)
+        raise
+    log.info("schema migrated v%d -> v%d: %s", start, SCHEMA_VERSION, ", ".join(name for _, name, _ in pending))
+    return start, SCHEMA_VERSION
 
 def ensure_schema(conn: sqlite3.Connection) -> None:
-    # טבלת flights מכסה את כל השדות בחוזה ה-HTML (ראה html_contract.html)
-    conn.executescript(
-        """
-        PRAGMA journal_mode=WAL;
-        PRAGMA synchronous=NORMAL;
-
-        CREATE TABLE IF NOT EXISTS flights (
-            id INTEGER PRIMARY KEY,
-            item_id TEXT,
-            selapp_item TEXT,
-            category TEXT,
-            provider TEXT,
-            affiliation TEXT,
-            promo_category TEXT,
-            destination TEXT,
-            dest_city TEXT,
-            dest_country TEXT,
-            trip_title TEXT,
-            price REAL,
-            currency TEXT,
-            price_text TEXT,
-            img_url TEXT,
-            badge_text TEXT,
-
-            out_from_city TEXT,
-            out_from_date TEXT,
-            out_from_time TEXT,
-            out_to_city   TEXT,
-            out_to_date   TEXT,
-            out_to_time   TEXT,
-            out_duration  TEXT,
-
-            back_from_city TEXT,
-            back_from_date TEXT,
-            back_from_time TEXT,
-            back_to_city   TEXT,
-            back_to_date   TEXT,
-            back_to_time   TEXT,
-            back_duration  TEXT,
-
-            note TEXT,
-            more_like TEXT,
-            url  TEXT,
-
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_seen  TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-
-            UNIQUE(item_id, selapp_item)
-        );
-
-        CREATE INDEX IF NOT EXISTS ix_flights_city_country ON flights(dest_country, dest_city);
-        CREATE INDEX IF NOT EXISTS ix_flights_last_seen    ON flights(last_seen);
-        CREATE INDEX IF NOT EXISTS ix_flights_price        ON flights(price);
-        """
-    )
-    conn.commit()
+    # טבלת flights מכסה את כל השדות בחוזה ה-HTML (ראה html_contract.html); הסכימה עצמה ב-MIGRATIONS
+    migrate(conn)
+
+def schema_sql() -> str:
+    """DDL של כל ה-migrations שהן SQL — מקור schema.sql. לקובץ חדש בלבד (יש בו ALTER), לא להרצה חוזרת."""
+    out = [f"-- schema.sql — נוצר מ-db.MIGRATIONS (PRAGMA user_version={SCHEMA_VERSION}); לא לערוך ידנית.",
+           "-- python db.py schema > schema.sql", ""]
+    for version, name, step in MIGRATIONS:
+        out.append(f"-- v{version}: {name}")
+        out.append(textwrap.dedent(step).strip() if isinstance(step, str) else f"-- (python migration: {step.__name__})")
+        out.append("")
+    return "\n".join(out)
 
 def touch_last_seen(conn: sqlite3.Connection, item_id: str, selapp_item: str) -> None:
     conn.execute(
@@ -77,32 +535,499 @@ def touch_last_seen(conn: sqlite3.Connection, item_id: str, selapp_item: str) ->
         (item_id, selapp_item),
     )
 
+def touch_seen_since(conn: sqlite3.Connection, since: str) -> int:
+    # מעדכן last_seen לכל השורות שנראו בטיק שהתחיל ב-since — משפט אחד
+    cur = conn.execute(
+        "UPDATE flights SET last_seen=CURRENT_TIMESTAMP WHERE last_seen >= ?",
+        (since,),
+    )
+    return cur.rowcount
+
+def bump_dest_seen(conn: sqlite3.Connection, since: str) -> int:
+    # dest_stats.last_seen לכל יעד שיש לו שורה שנראתה מאז since — משפט אחד לטיק
+    cur = conn.execute(
+        "UPDATE dest_stats SET last_seen = ?1 WHERE (country, city) IN "
+        "(SELECT dest_country_key, dest_city_key FROM flights WHERE last_seen >= ?1)",
+        (since,),
+    )
+    return cur.rowcount
+
+def get_state(conn: sqlite3.Connection, key: str, default: Optional[str] = None) -> Optional[str]:
+    row = conn.execute("SELECT value FROM scrape_state WHERE key=?", (key,)).fetchone()
+    return row[0] if row else default
+
+def set_state(conn: sqlite3.Connection, key: str, value: Optional[str]) -> None:
+    conn.execute(
+        "INSERT INTO scrape_state(key, value) VALUES(?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+        (key, value),
+    )
+
+# עמודות התוכן של flights (כמו בחוזה ה-HTML, ואחריהן הלו"ז המוקלד שהמפענח גוזר מהן);
+# מפתח ייחודי: (item_id, selapp_item)
+FLIGHT_COLS = [
+    "item_id","selapp_item","category","provider","affiliation","promo_category",
+    "destination","dest_city","dest_country","trip_title","price","currency","price_text",
+    "img_url","badge_text",
+    "out_from_city","out_from_date","out_from_time","out_to_city","out_to_date","out_to_time","out_duration",
+    "back_from_city","back_from_date","back_from_time","back_to_city","back_to_date","back_to_time","back_duration",
+    "note","more_like","url"
+] + TYPED_SCHEDULE_COLS
+
+# עמודות נגזרות שנכתבות יחד עם השורה (לא חלק מה-hash של התוכן)
+DEST_KEY_COLS = ["dest_city_key", "dest_country_key"]
+_WRITE_COLS = FLIGHT_COLS + DEST_KEY_COLS
+
+def dest_keys(row) -> Tuple[str, str]:
+    """(עיר, מדינה) מנורמלים למקלדת — אותו חישוב כמו ב-migration 3 (TRIM של SQLite = רווחים בלבד)."""
+    city = (row.get("dest_city") or "").strip(" ") or (row.get("destination") or "").strip(" ") or "יעד לא ידוע"
+    return city, (row.get("dest_country") or "").strip(" ")
+
+def _write_params(row) -> list:
+    return [row.get(c) for c in FLIGHT_COLS] + list(dest_keys(row))
+
+# נבנה פעם אחת; sqlite3 שומר את ה-statement המוכן ב-cache של החיבור
+UPSERT_FLIGHT_SQL = f"""
+INSERT INTO flights ({",".join(_WRITE_COLS)})
+VALUES ({",".join("?" for _ in _WRITE_COLS)})
+ON CONFLICT(item_id, selapp_item)
+DO UPDATE SET {",".join(f"{c}=excluded.{c}" for c in _WRITE_COLS if c not in ("item_id","selapp_item"))},
+    updated_at=CURRENT_TIMESTAMP, last_seen=CURRENT_TIMESTAMP
+"""
+
 def upsert_flight(conn: sqlite3.Connection, row: dict) -> None:
-    # מפתח ייחודי: (item_id, selapp_item)
-    cols = [
-        "item_id","selapp_item","category","provider","affiliation","promo_category",
-        "destination","dest_city","dest_country","trip_title","price","currency","price_text",
-        "img_url","badge_text",
-        "out_from_city","out_from_date","out_from_time","out_to_city","out_to_date","out_to_time","out_duration",
-        "back_from_city","back_from_date","back_from_time","back_to_city","back_to_date","back_to_time","back_duration",
-        "note","more_like","url"
-    ]
-    vals = [row.get(c) for c in cols]
-    placeholders = ",".join("?" for _ in cols)
-    set_expr = ",".join(f"{c}=excluded.{c}" for c in cols if c not in ("item_id","selapp_item"))
-    sql = f"""
-    INSERT INTO flights ({",".join(cols)})
-    VALUES ({placeholders})
-    ON CONFLICT(item_id, selapp_item)
-    DO UPDATE SET {set_expr}, updated_at=CURRENT_TIMESTAMP, last_seen=CURRENT_TIMESTAMP
-    """
-    conn.execute(sql, vals)
+    conn.execute(UPSERT_FLIGHT_SQL, _write_params(row))
 
-def list_distinct_city_country(conn: sqlite3.Connection):
-    # רשימת כל היעדים (גם כאלה שכבר לא באתר – ישבו בטבלה)
+def existing_keys(conn: sqlite3.Connection, keys) -> set:
+    """אילו מהמפתחות (item_id, selapp_item) כבר קיימים — שאילתה אחת דרך json_each."""
+    keys = list(keys)
+    if not keys:
+        return set()
+    rows = conn.execute(
+        "SELECT f.item_id, f.selapp_item FROM json_each(?) AS j "
+        "JOIN flights AS f ON f.item_id = json_extract(j.value, '$[0]') "
+        "AND f.selapp_item = json_extract(j.value, '$[1]')",
+        (json.dumps(keys),),
+    ).fetchall()
+    return {(r[0], r[1]) for r in rows}
+
+def upsert_flights(conn: sqlite3.Connection, rows) -> Tuple[int, int]:
+    """
+    upsert מרוכז: טעינה אחת של המפתחות הקיימים ו-executemany על statement מוכן.
+    לא פותח טרנזקציה בעצמו — הקורא עוטף ב-`with conn:`. מחזיר (inserted, updated).
+    """
+    rows = list(rows)
+    seen = existing_keys(conn, {(r["item_id"], r["selapp_item"]) for r in rows})
+    ins = upd = 0
+    for r in rows:
+        key = (r["item_id"], r["selapp_item"])
+        if key in seen:
+            upd += 1
+        else:
+            ins += 1
+            seen.add(key)
+    conn.executemany(UPSERT_FLIGHT_SQL, (_write_params(r) for r in rows))
+    return ins, upd
+
+def touch_ids(conn: sqlite3.Connection, ids) -> int:
+    # last_seen בלבד לכל ה-ids — משפט אחד לטיק, לא שורה-שורה
+    ids = list(ids)
+    if not ids:
+        return 0
+    cur = conn.execute(
+        "UPDATE flights SET last_seen=CURRENT_TIMESTAMP WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(ids),),
+    )
+    return cur.rowcount
+
+# ---------- diff מול תמונת זיכרון ----------
+
+FlightKey = Tuple[str, str]
+
+def row_hash(values) -> int:
+    """
+    hash של עמודות התוכן (לפי סדר FLIGHT_COLS). hash() של tuple — מהיר, ומספיק לתמונה
+    שחיה רק בתהליך הנוכחי; 150 ו-150.0 נותנים אותו hash, כך שעמודת REAL לא יוצרת "שינוי".
+    """
+    return hash(tuple(values))
+
+class FlightDiff(NamedTuple):
+    changed: List[dict]       # שורות חדשות או שהתוכן שלהן השתנה -> upsert
+    touch_ids: List[int]      # שורות שנראו בלי שינוי -> last_seen בלבד
+    missing: List[FlightKey]  # מפתחות "ללא שינוי" שאין להם שורה ב-DB (cache לא מסונכרן)
+
+ARCHIVE_GEN_KEY = "archive_gen"  # scrape_state: מונה שכל העברה לארכיון מקדמת (maintenance.archive_stale)
+
+class FlightImage:
+    """
+    תמונת זיכרון של flights: (item_id, selapp_item) -> (id, row_hash).
+    נטענת פעם אחת מהחיבור הכותב, ומשם רק שורות שהתוכן שלהן באמת השתנה נכתבות;
+    כל השאר מקבלות last_seen במשפט אחד. כך updated_at = "התוכן השתנה", ולא "נסרק".
+    כל הכתיבות ל-flights חייבות לעבור דרכה (או לקרוא ל-clear/forget) כדי שלא תתיישן;
+    מחיקות מתהליך אחר (maintenance.py מה-CLI) מתגלות דרך ARCHIVE_GEN_KEY, והתמונה נטענת מחדש.
+    """
+    def __init__(self):
+        self._conn: Optional[sqlite3.Connection] = None
+        self._gen: Optional[str] = None
+        self._rows: Dict[FlightKey, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def clear(self) -> None:
+        self._conn = None
+        self._gen = None
+        self._rows = {}
+
+    def forget(self, keys) -> None:
+        for k in keys:
+            self._rows.pop(tuple(k), None)
+
+    def load(self, conn: sqlite3.Connection) -> None:
+        # חיבור אחר (DB אחר, כלי בדיקה) או ארכוב מאז הטעינה הקודמת = טעינה מחדש
+        gen = get_state(conn, ARCHIVE_GEN_KEY)
+        if self._conn is conn and self._gen == gen:
+            return
+        if self._conn is conn:
+            log.info("flights archived since the image was loaded (archive_gen=%s); reloading", gen)
+        cur = conn.cursor()
+        cur.row_factory = None  # tuples: זול יותר מ-sqlite3.Row על כל הטבלה
+        cur.execute(f"SELECT id, {','.join(FLIGHT_COLS)} FROM flights")
+        self._rows = {(r[1], r[2]): (r[0], row_hash(r[1:])) for r in cur}
+        self._conn = conn
+        self._gen = gen
+
+    def diff(self, rows, unchanged_keys=()) -> FlightDiff:
+        last: Dict[FlightKey, dict] = {}
+        for r in rows:  # מפתח כפול בעמוד: השורה האחרונה קובעת, כמו ב-upsert
+            last[(r["item_id"], r["selapp_item"])] = r
+        changed, touch, missing = [], [], []
+        for key, r in last.items():
+            cur = self._rows.get(key)
+            if cur is not None and cur[1] == row_hash(r.get(c) for c in FLIGHT_COLS):
+                touch.append(cur[0])
+            else:
+                changed.append(r)
+        for key in unchanged_keys:
+            key = tuple(key)
+            if key in last:
+                continue
+            cur = self._rows.get(key)
+            if cur is None:
+                missing.append(key)
+            else:
+                touch.append(cur[0])
+        return FlightDiff(changed, touch, missing)
+
+    def entries_for(self, conn: sqlite3.Connection, rows) -> Dict[FlightKey, Tuple[int, int]]:
+        """ids של שורות שנכתבו עכשיו (בתוך הטרנזקציה); מוחלים ב-update רק אחרי commit."""
+        rows = list(rows)
+        if not rows:
+            return {}
+        keys = [(r["item_id"], r["selapp_item"]) for r in rows]
+        ids = {
+            (r[1], r[2]): r[0]
+            for r in conn.execute(
+                "SELECT f.id, f.item_id, f.selapp_item FROM json_each(?) AS j "
+                "JOIN flights AS f ON f.item_id = json_extract(j.value, '$[0]') "
+                "AND f.selapp_item = json_extract(j.value, '$[1]')",
+                (json.dumps(keys),),
+            )
+        }
+        return {k: (ids[k], row_hash(r.get(c) for c in FLIGHT_COLS)) for k, r in zip(keys, rows) if k in ids}
+
+    def update(self, entries: Dict[FlightKey, Tuple[int, int]]) -> None:
+        self._rows.update(entries)
+
+# ---------- היסטוריית מחירים / זמינות ----------
+
+HIST_PRICE, HIST_CURRENCY, HIST_BADGE, HIST_SCHEDULE = 1, 2, 4, 8
+HIST_NEW = 16  # הטיסה נראתה לראשונה
+SCHEDULE_COLS = [
+    "out_from_date","out_from_time","out_to_date","out_to_time","out_duration",
+    "back_from_date","back_from_time","back_to_date","back_to_time","back_duration",
+]
+_HIST_COLS = ["price", "currency", "badge_text"] + SCHEDULE_COLS
+
+HISTORY_INSERT_SQL = """
+INSERT INTO flight_history(flight_id, ts, changed, price, price_delta, currency, badge_text, schedule)
+VALUES (?,?,?,?,?,?,?,?)
+ON CONFLICT(flight_id, ts) DO UPDATE SET
+    changed=changed | excluded.changed, price=excluded.price,
+    price_delta=COALESCE(price_delta, 0) + COALESCE(excluded.price_delta, 0),
+    currency=COALESCE(excluded.currency, currency), badge_text=COALESCE(excluded.badge_text, badge_text),
+    schedule=COALESCE(excluded.schedule, schedule)
+"""
+
+def _schedule(row) -> str:
+    return "|".join(row.get(c) or "" for c in SCHEDULE_COLS)
+
+def history_before(conn: sqlite3.Connection, rows) -> Dict[FlightKey, dict]:
+    """הערכים הנוכחיים (לפני ה-upsert) של השדות שנרשמים בהיסטוריה — שאילתה אחת לטיק."""
+    keys = [(r["item_id"], r["selapp_item"]) for r in rows]
+    if not keys:
+        return {}
+    cur = conn.execute(
+        f"SELECT f.item_id, f.selapp_item, {','.join('f.' + c for c in _HIST_COLS)} FROM json_each(?) AS j "
+        "JOIN flights AS f ON f.item_id = json_extract(j.value, '$[0]') "
+        "AND f.selapp_item = json_extract(j.value, '$[1]')",
+        (json.dumps(keys),),
+    )
+    return {(r[0], r[1]): dict(zip(_HIST_COLS, tuple(r)[2:])) for r in cur}
+
+def record_history(conn: sqlite3.Connection, rows, before: Dict[FlightKey, dict],
+                   ids: Dict[FlightKey, int], ts: Optional[int] = None) -> int:
+    """
+    מוסיף שורת היסטוריה לכל טיסה שמחיר/מטבע/badge/לו"ז שלה השתנו (או שנראתה לראשונה).
+    executemany אחד לטיק; לא פותח טרנזקציה. מחזיר כמה שורות נרשמו.
+    """
+    ts = int(ts if ts is not None else time.time())
+    batch = []
+    for r in rows:
+        key = (r["item_id"], r["selapp_item"])
+        fid = ids.get(key)
+        if fid is None:
+            continue
+        old = before.get(key)
+        sched = _schedule(r)
+        if old is None:
+            batch.append((fid, ts, HIST_NEW | HIST_PRICE, r.get("price"), None,
+                          r.get("currency"), r.get("badge_text"), sched))
+            continue
+        changed, delta = 0, None
+        if r.get("price") != old["price"]:
+            changed |= HIST_PRICE
+            if r.get("price") is not None and old["price"] is not None:
+                delta = r["price"] - old["price"]
+        if r.get("currency") != old["currency"]:
+            changed |= HIST_CURRENCY
+        if r.get("badge_text") != old["badge_text"]:
+            changed |= HIST_BADGE
+        if sched != _schedule(old):
+            changed |= HIST_SCHEDULE
+        if not changed:
+            continue  # שינוי בשדה שלא נרשם בהיסטוריה (כותרת, תמונה...)
+        batch.append((fid, ts, changed, r.get("price"), delta,
+                      r.get("currency") if changed & HIST_CURRENCY else None,
+                      r.get("badge_text") if changed & HIST_BADGE else None,
+                      sched if changed & HIST_SCHEDULE else None))
+    conn.executemany(HISTORY_INSERT_SQL, batch)
+    return len(batch)
+
+def flight_history(conn: sqlite3.Connection, flight_id: int, limit: int = 100):
+    # "ההיסטוריה של טיסה X" — סריקת טווח על ה-PK (flight_id, ts)
+    return conn.execute(
+        "SELECT ts, changed, price, price_delta, currency, badge_text, schedule "
+        "FROM flight_history WHERE flight_id=? ORDER BY ts DESC LIMIT ?",
+        (flight_id, limit),
+    ).fetchall()
+
+def price_drops_since(conn: sqlite3.Connection, since_ts: int, limit: int = 200):
+    # "כל הירידות מאז T" — האינדקס החלקי ix_history_drops
     return conn.execute(
-        "SELECT DISTINCT COALESCE(dest_country,'') AS country, COALESCE(dest_city,'') AS city "
-        "FROM flights "
-        "WHERE TRIM(COALESCE(dest_city,'')) <> '' "
-        "ORDER BY country, city"
+        "SELECT h.ts, h.price, h.price_delta, f.id AS flight_id, f.dest_city, f.dest_country, f.currency, f.url "
+        "FROM flight_history AS h JOIN flights AS f ON f.id = h.flight_id "
+        "WHERE h.price_delta < 0 AND h.ts >= ? ORDER BY h.ts DESC LIMIT ?",
+        (since_ts, limit),
     ).fetchall()
+
+HISTORY_COMPACTED_KEY = "history_compacted_until"  # scrape_state: epoch; מה שלפניו כבר דולל
+
+def compact_history(conn: sqlite3.Connection, keep_full_days: float = 30, bucket_s: int = 86400) -> Tuple[int, int]:
+    """
+    דילול היסטוריה ישנה: מעבר ל-keep_full_days נשארת שורה אחת לכל (טיסה, bucket) —
+    המחיר האחרון, סכום ה-deltas (ירידה נטו נשמרת), OR של הביטים והערך האחרון של כל שדה.
+    אינקרמנטלי: רק החלון [watermark, cutoff), מיושר ל-bucket כך ש-bucket מדולל פעם אחת ושלם;
+    ה-watermark נשמר ב-scrape_state באותה טרנזקציה. מחזיר (שורות לפני, שורות אחרי) בחלון.
+    """
+    cutoff = int(time.time() - keep_full_days * 86400) // bucket_s * bucket_s
+    lo = int(get_state(conn, HISTORY_COMPACTED_KEY) or 0) // bucket_s * bucket_s
+    if lo >= cutoff:
+        return 0, 0
+    cur = conn.execute(
+        "SELECT flight_id, ts, changed, price, price_delta, currency, badge_text, schedule "
+        "FROM flight_history WHERE ts >= ? AND ts < ? ORDER BY flight_id, ts",
+        (lo, cutoff),
+    )
+    merged: Dict[Tuple[int, int], list] = {}
+    before = 0
+    for fid, ts, changed, price, delta, currency, badge, sched in cur:
+        before += 1
+        m = merged.get((fid, ts // bucket_s))
+        if m is None:
+            merged[(fid, ts // bucket_s)] = [fid, ts, changed, price, delta, currency, badge, sched]
+            continue
+        m[1], m[2], m[3] = ts, m[2] | changed, price
+        if delta is not None:
+            m[4] = (m[4] or 0) + delta
+        m[5], m[6], m[7] = currency or m[5], badge or m[6], sched or m[7]
+    with conn:
+        if before != len(merged):
+            conn.execute("DELETE FROM flight_history WHERE ts >= ? AND ts < ?", (lo, cutoff))
+            conn.executemany(HISTORY_INSERT_SQL, merged.values())
+        set_state(conn, HISTORY_COMPACTED_KEY, str(cutoff))
+    return before, len(merged)
+
+# ---------- שאילתות קריאה ----------
+
+# dest_stats מתוחזקת ע"י triggers על flights (migration 4): שורה ליעד, כבר בסדר ה-PK (country, city)
+DEST_KEYBOARD_SQL = """
+SELECT city, country, cnt
+FROM dest_stats
+ORDER BY country, city
+"""
+DEST_SUMMARY_SQL = """
+SELECT COALESCE(NULLIF(destination, ''), city) AS destination, cnt
+FROM dest_stats
+ORDER BY cnt DESC, destination ASC
+LIMIT ?
+"""
+# ORDER BY = סדר האינדקס ix_flights_dest_key, כך שאין מיון; ראה `bench_db.py plans`
+DISTINCT_CITY_COUNTRY_SQL = """
+SELECT DISTINCT dest_country_key AS country, dest_city_key AS city
+FROM flights
+WHERE TRIM(dest_city) <> ''
+ORDER BY dest_country_key, dest_city_key
+"""
+
+def dest_rows(conn: sqlite3.Connection):
+    # [(city, country, cnt)] למקלדת היעדים
+    return conn.execute(DEST_KEYBOARD_SQL).fetchall()
+
+def dest_summary(conn: sqlite3.Connection, limit: int = 50):
+    # ([(destination, cnt)], total) לסיכום
+    rows = conn.execute(DEST_SUMMARY_SQL, (limit,)).fetchall()
+    total = conn.execute("SELECT COALESCE(SUM(cnt), 0) FROM dest_stats").fetchone()[0]
+    return rows, total
+
+def list_distinct_city_country(conn: sqlite3.Connection):
+    # רשימת כל היעדים ב-flights (כולל כאלה שירדו מהאתר, עד שהתחזוקה מעבירה אותם לארכיון)
+    return conn.execute(DISTINCT_CITY_COUNTRY_SQL).fetchall()
+
+_FTS_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def fts_query(text: str) -> str:
+    """
+    טקסט חופשי של משתמש -> שאילתת FTS5: כל מילה כ-prefix ("אתו"*), כולן חייבות להופיע.
+    רק אותיות/ספרות נשמרות, כך שתחביר FTS (AND, NEAR, מרכאות...) לא דולף מהמשתמש.
+    """
+    return " ".join(f'"{t}"*' for t in _FTS_TOKEN_RE.findall(text or "")[:8])
+
+# הדירוג (bm25 ואז מחיר) על כל ההתאמות, בלי תקרת מועמדים: שורות עם אותו טקסט מקבלות אותו ציון,
+# וכל חיתוך לפני המיון היה מפיל דילים זולים יותר בלי סימן. המחיר: bm25 לכל התאמה — זול כל עוד
+# flights בגודל של מה שבאתר (maintenance.archive_stale מעביר את השאר לארכיון).
+SEARCH_SQL = """
+SELECT f.id, f.destination, f.dest_city, f.dest_country, f.trip_title, f.price, f.currency,
+       f.price_text, f.out_date, f.out_from_time, f.back_date, f.url
+FROM flights_fts
+JOIN flights AS f ON f.id = flights_fts.rowid
+WHERE flights_fts MATCH ?
+ORDER BY bm25(flights_fts, 4.0, 3.0, 2.0, 1.0, 0.5), f.price
+LIMIT ?
+"""
+
+def search_flights(conn: sqlite3.Connection, text: str, limit: int = 10):
+    """
+    חיפוש ב-destination/עיר/מדינה/כותרת/הערה של flights בלבד; [] לטקסט בלי מילים.
+    flights_archive לא מאונדקס ב-FTS, כך שטיסות שעברו לארכיון לא יופיעו.
+    """
+    q = fts_query(text)
+    if not q:
+        return []
+    return conn.execute(SEARCH_SQL, (q, limit)).fetchall()
+
+# ---------- סינון לפי תאריכים / אורך טיול ----------
+
+def _day_min(d) -> int:
+    d = date.fromisoformat(d) if isinstance(d, str) else d
+    return (d - _EPOCH_DAY).days * 1440
+
+def flights_query_sql(date_from=None, date_to=None, min_days: Optional[int] = None, max_days: Optional[int] = None,
+                      city_key: Optional[str] = None, country_key: Optional[str] = None,
+                      limit: int = 50) -> Tuple[str, list]:
+    """
+    טיסות שיוצאות בין date_from ל-date_to (כולל; date או "YYYY-MM-DD") ואורך הטיול בטווח, לפי שעת יציאה.
+    כל תנאי הוא טווח על עמודה מאונדקסת:
+    - יעד: ix_flights_dest_dep (country, city, out_dep_min)
+    - אורך טיול: טווח קצר נפרש ל-IN, כך ש-ix_flights_trip_dep נותן סריקת טווח על out_dep_min לכל ערך;
+      ה-planner (אחרי ANALYZE) בוחר בינו לבין ix_flights_out_dep, שכבר ממוין לפי הסדר המבוקש
+    - רק תאריכים: ix_flights_out_dep
+    הסדר תמיד לפי שעת יציאה (לפני ה-LIMIT), גם כשיש סינון אורך טיול — לא לפי trip_days,
+    שהיה מעדיף את הטיולים הקצרים.
+    """
+    where, params = [], []
+    by_dest = country_key is not None and city_key is not None
+    if by_dest:
+        where.append("dest_country_key = ? AND dest_city_key = ?")
+        params += [country_key, city_key]
+    if min_days is not None or max_days is not None:
+        lo, hi = min_days or 1, max_days
+        if hi is not None and hi - lo <= 31:
+            where.append(f"trip_days IN ({','.join('?' * (hi - lo + 1))})")
+            params += list(range(lo, hi + 1))
+        else:
+            where.append("trip_days >= ?" + (" AND trip_days <= ?" if hi is not None else ""))
+            params += [lo] + ([hi] if hi is not None else [])
+    where.append("out_dep_min >= ?")
+    params.append(_day_min(date_from) if date_from is not None else 0)
+    if date_to is not None:
+        where.append("out_dep_min < ?")
+        params.append(_day_min(date_to) + 1440)
+    params.append(limit)
+    return ("SELECT id, destination, dest_city, dest_country, price, currency, price_text, "
+            "out_date, back_date, out_dep_min, back_dep_min, trip_days, out_duration_min, back_duration_min, url "
+            f"FROM flights WHERE {' AND '.join(where)} ORDER BY out_dep_min LIMIT ?", params)
+
+def query_flights(conn: sqlite3.Connection, date_from=None, date_to=None,
+                  min_days: Optional[int] = None, max_days: Optional[int] = None,
+                  city_key: Optional[str] = None, country_key: Optional[str] = None, limit: int = 50):
+    """שורות flights לפי flights_query_sql."""
+    return conn.execute(*flights_query_sql(date_from, date_to, min_days, max_days, city_key, country_key, limit)).fetchall()
+
+# ---------- facade אסינכרוני ל-handlers ----------
+# כל פונקציה רצה על חיבור קריאה ב-thread pool החסום של ה-ConnectionManager (DB_READERS threads),
+# כך ש-handler לעולם לא מבצע I/O של SQLite על ה-event loop.
+
+async def fetch_dest_rows():
+    """`await db.fetch_dest_rows()` -> [(city, country, cnt)]."""
+    return await read(dest_rows)
+
+async def fetch_dest_summary(limit: int = 50):
+    """`await db.fetch_dest_summary(50)` -> ([(destination, cnt)], total)."""
+    return await read(dest_summary, limit)
+
+async def fetch_distinct_city_country():
+    return await read(list_distinct_city_country)
+
+async def fetch_flight_history(flight_id: int, limit: int = 100):
+    return await read(flight_history, flight_id, limit)
+
+async def fetch_search(text: str, limit: int = 10):
+    """`await db.fetch_search("אתונה")` -> שורות flights לפי רלוונטיות ומחיר."""
+    return await read(search_flights, text, limit)
+
+async def fetch_flights(date_from=None, date_to=None, min_days: Optional[int] = None, max_days: Optional[int] = None,
+                        city_key: Optional[str] = None, country_key: Optional[str] = None, limit: int = 50):
+    """`await db.fetch_flights("2025-09-01", "2025-09-30", min_days=3, max_days=5)`."""
+    return await read(query_flights, date_from, date_to, min_days, max_days, city_key, country_key, limit)
+
+async def fetch_price_drops(since_ts: int, limit: int = 200):
+    return await read(price_drops_since, since_ts, limit)
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="tustus DB schema tools")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("schema", help="print the schema DDL generated from MIGRATIONS")
+    p_mig = sub.add_parser("migrate", help="apply pending migrations to a DB file")
+    p_mig.add_argument("--db", default=None, help="DB path (default: config.DB_PATH)")
+    args = ap.parse_args(argv)
+    if args.cmd == "schema":
+        print(schema_sql())
+    elif args.cmd == "migrate":
+        conn = get_conn(args.db)
+        print("user_version %d -> %d" % migrate(conn))
+        conn.close()
+
+if __name__ == "__main__":
+    main()
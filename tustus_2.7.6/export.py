@@ -0,0 +1,187 @@
+# export.py
+# ייצוא עמודתי (Parquet) של flights ו-flight_history לאנליטיקה אופליין, במקום read_sql על הקובץ החי:
+#
+#   <EXPORT_DIR>/flights/scrape_date=YYYY-MM-DD/part-<from>.parquet
+#   <EXPORT_DIR>/flight_history/scrape_date=YYYY-MM-DD/part-<from>.parquet
+#
+# - אינקרמנטלי: כל ריצה מייצאת רק את החלון [watermark, עכשיו - EXPORT_LAG_S) לפי updated_at
+#   (ב-history: ts), וה-watermark נשמר ב-scrape_state. שורה ב-flights שהתוכן שלה השתנה מופיעה
+#   שוב במחיצה של יום השינוי — הגרסה האחרונה היא זו עם updated_at הגבוה ביותר לכל id.
+# - הקריאה כולה בטרנזקציית קריאה אחת על חיבור query_only: snapshot עקבי של ה-WAL,
+#   והבוט ממשיך לכתוב בלי להמתין.
+# - טיפוסים: REAL -> float64, TIMESTAMP -> timestamp[s, UTC], DATE -> date32, *_time "HH:MM" -> time32;
+#   ההמרה נעשית ב-SQL (ערך לא תקין = NULL) ו-pyarrow רק בונה מערכים ממספרים.
+# - קובץ נקרא לפי תחילת החלון: ריצה חוזרת אחרי קריסה (לפני שה-watermark נשמר) דורסת אותו
+#   ב-superset שלו, ולא משכפלת שורות.
+#
+# דורש pyarrow (לא חלק מ-requirements.txt של הבוט):
+#   python export.py run            # אינקרמנטלי
+#   python export.py run --full     # מוחק את הייצוא הקיים ומייצא הכל מחדש
+#   python export.py status
+# pandas: pd.read_parquet("data/export/flights")
+from __future__ import annotations
+import argparse, json, logging, os, pathlib, shutil, sqlite3, time
+from typing import Dict, List, Optional, Tuple
+
+import config
+import db
+
+log = logging.getLogger("tustus.export")
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# (טבלה, עמודת watermark, ביטוי SQL לתאריך המחיצה, ביטוי לגבול העליון של החלון)
+_TABLES = {
+    "flights": ("updated_at", "date(updated_at)",
+                "strftime('%Y-%m-%d %H:%M:%S', 'now', ?)"),
+    "flight_history": ("ts", "date(ts, 'unixepoch')",
+                       "CAST(strftime('%s', 'now', ?) AS INTEGER)"),
+}
+
+def _state_key(table: str) -> str:
+    return f"export.{table}.watermark"
+
+def _time_expr(col: str) -> str:
+    # "HH:MM" -> שניות מחצות; כל דבר אחר -> NULL
+    h = f"CAST(substr({col}, 1, instr({col}, ':') - 1) AS INTEGER)"
+    m = f"CAST(substr({col}, instr({col}, ':') + 1, 2) AS INTEGER)"
+    return (f"CASE WHEN {col} GLOB '[0-9]:[0-5][0-9]' OR {col} GLOB '[0-2][0-9]:[0-5][0-9]' "
+            f"THEN CASE WHEN {h} < 24 THEN {h} * 3600 + {m} * 60 END END")
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[Tuple[str, str, "pa.DataType"]]:
+    """(שם, ביטוי SELECT, טיפוס arrow) לכל עמודה, לפי הטיפוס המוצהר בסכימה."""
+    out = []
+    for _, name, decl, *_ in conn.execute(f"PRAGMA table_info({table})"):
+        decl = (decl or "").upper()
+        if table == "flight_history" and name == "ts":
+            out.append((name, name, pa.timestamp("s", tz="UTC")))  # epoch seconds
+        elif decl == "TIMESTAMP":
+            out.append((name, f"CAST(strftime('%s', {name}) AS INTEGER)", pa.timestamp("s", tz="UTC")))
+        elif decl == "DATE":
+            out.append((name, f"CAST(julianday({name}) - 2440587.5 AS INTEGER)", pa.date32()))
+        elif name.endswith("_time") and decl == "TEXT":
+            out.append((name, _time_expr(name), pa.time32("s")))
+        elif "INT" in decl:
+            out.append((name, name, pa.int64()))
+        elif decl in ("REAL", "FLOAT", "DOUBLE"):
+            out.append((name, name, pa.float64()))
+        else:
+            out.append((name, name, pa.string()))
+    return out
+
+def _part_name(lo) -> str:
+    token = "".join(ch for ch in str(lo) if ch.isdigit()) or "0"
+    return f"part-{token}.parquet"
+
+def _export_table(conn: sqlite3.Connection, table: str, out_dir: pathlib.Path,
+                  lag_s: float, batch: int) -> Dict[str, object]:
+    wm_col, date_expr, hi_expr = _TABLES[table]
+    lo = db.get_state(conn, _state_key(table))
+    if lo is None:
+        lo = "" if wm_col == "updated_at" else 0  # "" < כל timestamp טקסטואלי
+    else:
+        lo = lo if wm_col == "updated_at" else int(lo)
+    hi = conn.execute(f"SELECT {hi_expr}", (f"-{int(lag_s)} seconds",)).fetchone()[0]
+    cols = _columns(conn, table)
+    schema = pa.schema([(name, typ) for name, _, typ in cols])
+    sql = (f"SELECT {date_expr}, {', '.join(expr for _, expr, _ in cols)} FROM {table} "
+           f"WHERE {wm_col} >= ? AND {wm_col} < ?")
+    cur = conn.cursor()
+    cur.row_factory = None  # tuples
+    cur.execute(sql, (lo, hi))
+    writers: Dict[str, Tuple["pq.ParquetWriter", pathlib.Path, pathlib.Path]] = {}
+    n = 0
+    try:
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                break
+            n += len(rows)
+            by_date: Dict[str, list] = {}
+            for r in rows:
+                by_date.setdefault(r[0] or "unknown", []).append(r[1:])
+            for day, part in by_date.items():
+                if day not in writers:
+                    path = out_dir / table / f"scrape_date={day}" / _part_name(lo)
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    tmp = path.with_suffix(".parquet.tmp")
+                    writers[day] = (pq.ParquetWriter(str(tmp), schema, compression="zstd"), tmp, path)
+                arrays = [pa.array(values, type=typ) for values, (_, _, typ) in zip(zip(*part), cols)]
+                writers[day][0].write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+    finally:
+        for w, _, _ in writers.values():
+            w.close()
+    for _, tmp, path in writers.values():
+        os.replace(tmp, path)  # אטומי: קורא לעולם לא רואה קובץ חלקי
+    return {"rows": n, "files": len(writers), "from": lo, "to": hi}
+
+def run_export(path: Optional[str] = None, out_dir=None, full: bool = False) -> Dict[str, Dict[str, object]]:
+    """
+    ייצוא אינקרמנטלי של כל הטבלאות ב-_TABLES. מחזיר לכל טבלה {rows, files, from, to}.
+    watermark חדש נשמר רק אחרי שכל הקבצים במקומם.
+    """
+    if pa is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    out_dir = pathlib.Path(out_dir or getattr(config, "EXPORT_DIR", config.DATA_DIR / "export"))
+    lag_s = getattr(config, "EXPORT_LAG_S", 5)
+    batch = int(getattr(config, "EXPORT_BATCH", 5000))
+    t0 = time.perf_counter()
+    wconn = db.get_conn(path)
+    db.migrate(wconn)
+    if full:
+        for table in _TABLES:
+            shutil.rmtree(out_dir / table, ignore_errors=True)
+        with wconn:
+            wconn.execute("DELETE FROM scrape_state WHERE key LIKE 'export.%'")
+    rconn = db.get_conn(path)
+    rconn.execute("PRAGMA query_only=ON")
+    res: Dict[str, Dict[str, object]] = {}
+    try:
+        rconn.execute("BEGIN")  # snapshot אחד לכל הטבלאות; נקבע בקריאה הראשונה
+        for table in _TABLES:
+            res[table] = _export_table(rconn, table, out_dir, lag_s, batch)
+        rconn.rollback()
+        with wconn:
+            for table, r in res.items():
+                db.set_state(wconn, _state_key(table), str(r["to"]))
+    finally:
+        rconn.close()
+        wconn.close()
+    log.info("export -> %s | %s | %.1fs", out_dir,
+             ", ".join(f"{t}: {r['rows']} rows/{r['files']} files" for t, r in res.items()),
+             time.perf_counter() - t0)
+    return res
+
+def status(path: Optional[str] = None, out_dir=None) -> Dict[str, Dict[str, object]]:
+    out_dir = pathlib.Path(out_dir or getattr(config, "EXPORT_DIR", config.DATA_DIR / "export"))
+    conn = db.get_conn(path)
+    try:
+        return {table: {"watermark": db.get_state(conn, _state_key(table)),
+                        "files": len(list((out_dir / table).glob("*/*.parquet")))}
+                for table in _TABLES}
+    finally:
+        conn.close()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Parquet export of flights.db for offline analytics")
+    ap.add_argument("--db", default=None, help="DB path (default: config.DB_PATH)")
+    ap.add_argument("--out", default=None, help="export dir (default: config.EXPORT_DIR)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_run = sub.add_parser("run")
+    p_run.add_argument("--full", action="store_true", help="drop the existing export and start over")
+    sub.add_parser("status")
+    args = ap.parse_args(argv)
+    if args.cmd == "run":
+        try:
+            print(json.dumps(run_export(args.db, args.out, args.full), indent=2, ensure_ascii=False))
+        except RuntimeError as e:
+            raise SystemExit(str(e))
+    elif args.cmd == "status":
+        print(json.dumps(status(args.db, args.out), indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -5,29 +5,50 @@ from telegram import Update, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
 import db
-import logic
 import config
 from utils_summary import render_dest_summary_leaderboard
-from telegram_view import build_destinations_keyboard
+from telegram_view import KeyboardCache, build_destinations_keyboard, render_search_results
+
+# מקלדות יעדים מוכנות; מתאפס כשהמוניטור מקדם את bot_data["render_gen"] (ראה invalidate_screens)
+_KEYBOARD_CACHE = KeyboardCache(getattr(config, "RENDER_CACHE_SIZE", 64))
+
+def invalidate_screens(bot_data: dict) -> None:
+    # נקרא אחרי טיק/תחזוקה ששינו את flights
+    bot_data["render_gen"] = bot_data.get("render_gen", 0) + 1
 
 # ===== Greeting (header) =====
 def _greeting_line(version: str) -> str:
     return f"🚀☕️ תפסנו עוד דיל שממריא מהר יותר מהקפה של הבוקר.\nvtustus_{version}\u2063"
 
 # ===== Build main screen (text + keyboard) =====
-def _build_main_screen(selected: Optional[str] = None) -> Tuple[str, InlineKeyboardMarkup]:
-    conn = db.get_conn()
+async def _build_main_screen(selected: Optional[str] = None, generation: int = 0) -> Tuple[str, InlineKeyboardMarkup]:
     text = _greeting_line(getattr(config, "SCRIPT_VERSION", "V2.x"))
-    rows = logic.get_dest_rows_for_keyboard(conn)  # [(city, country, cnt)]
-    km = build_destinations_keyboard(rows, selected or "*")
+    selected = selected or "*"
+    km = _KEYBOARD_CACHE.get(generation, selected)
+    if km is None:
+        # הקריאה רצה ב-thread של קוראים (facade של db) — לא חוסמת את ה-event loop
+        rows = await db.fetch_dest_rows()  # [(city, country, cnt)]
+        km = build_destinations_keyboard(rows, selected)
+        _KEYBOARD_CACHE.put(generation, selected, km)
     return text, km
 
 # ===== Handlers =====
 async def handle_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    text, km = _build_main_screen(selected="*")
+    text, km = await _build_main_screen("*", context.bot_data.get("render_gen", 0))
     await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=km)
 
+async def handle_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /search <טקסט> — חיפוש FTS5 ביעד/עיר/מדינה/כותרת (עברית ואנגלית, התאמת תחילית); בלי הארכיון
+    query = " ".join(context.args or []).strip()
+    if not query:
+        await update.effective_message.reply_text("שימוש: /search <יעד או מילה>\nלמשל: /search אתונה")
+        return
+    rows = await db.fetch_search(query, limit=getattr(config, "SEARCH_LIMIT", 10))
+    await update.effective_message.reply_text(
+        render_search_results(query, rows), parse_mode="HTML", disable_web_page_preview=True
+    )
+
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     if not q:
@@ -38,8 +59,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Summary (Leaderboard)
     if data == "sum":
-        conn = db.get_conn()
-        rows, total = logic.get_dest_summary(conn, limit=50)  # [(destination, cnt)]
+        rows, total = await db.fetch_dest_summary(limit=50)  # [(destination, cnt)]
         try:
             html_text = render_dest_summary_leaderboard(rows, total_count=total, top_n=10, bar_len=12)
         except Exception as e:
@@ -55,10 +75,10 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         selected = data.split(":",1)[1]
 
     # Refresh / default
-    text, km = _build_main_screen(selected)
+    text, km = await _build_main_screen(selected, context.bot_data.get("render_gen", 0))
     old_text = q.message.text or ""
     old_km = q.message.reply_markup
-    if old_text == text and str(old_km) == str(km):
+    if old_text == text and old_km == km:  # השוואת כפתורים, בלי לסדר את שתי המקלדות למחרוזת
         text += "\u2063"
     await q.edit_message_text(text, reply_markup=km)
     return
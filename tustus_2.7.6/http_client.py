@@ -0,0 +1,147 @@
+# http_client.py
+# לקוח HTTP ארוך-חיים לסורק: pool חיבורים, keep-alive, דחיסה, timeouts נפרדים ומדידת זמנים לכל בקשה
+from __future__ import annotations
+import collections
+import logging
+import time
+from typing import Deque, Dict, NamedTuple, Optional
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+
+log = logging.getLogger("tustus.http")
+
+try:  # aiohttp ו-urllib3 מפענחים br רק אם Brotli מותקן
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+def default_headers() -> Dict[str, str]:
+    return {
+        "User-Agent": getattr(config, "USER_AGENT", "Mozilla/5.0"),
+        "Accept-Encoding": ACCEPT_ENCODING,
+        "Accept-Language": "he-IL,he;q=0.9,en;q=0.7",
+    }
+
+class Fetched(NamedTuple):
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+    charset: Optional[str]
+    timing: Dict[str, object]
+
+def _ms(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    return round((b - a) * 1000, 1) if a is not None and b is not None else None
+
+def _trace_config() -> aiohttp.TraceConfig:
+    # כל callback רושם חותמת זמן ל-dict של הבקשה (trace_request_ctx)
+    tc = aiohttp.TraceConfig()
+
+    def _mark(name):
+        async def _cb(session, ctx, params):
+            if ctx.trace_request_ctx is not None:
+                ctx.trace_request_ctx[name] = time.perf_counter()
+        return _cb
+
+    tc.on_request_start.append(_mark("start"))
+    tc.on_dns_resolvehost_start.append(_mark("dns_start"))
+    tc.on_dns_resolvehost_end.append(_mark("dns_end"))
+    tc.on_dns_cache_hit.append(_mark("dns_cache_hit"))
+    tc.on_connection_create_start.append(_mark("connect_start"))
+    tc.on_connection_create_end.append(_mark("connect_end"))
+    tc.on_connection_reuseconn.append(_mark("reused"))
+    tc.on_request_headers_sent.append(_mark("sent"))
+    tc.on_request_end.append(_mark("headers"))
+    return tc
+
+def _timing(marks: Dict[str, float], done: float, nbytes: int, encoding: Optional[str]) -> Dict[str, object]:
+    dns = _ms(marks.get("dns_start"), marks.get("dns_end"))
+    connect = _ms(marks.get("connect_start"), marks.get("connect_end"))
+    if connect is not None and dns is not None:
+        connect = round(connect - dns, 1)  # connection_create כולל את ה-DNS
+    return {
+        "dns_ms": dns,
+        "connect_ms": connect,  # TCP + TLS
+        "ttfb_ms": _ms(marks.get("sent"), marks.get("headers")),
+        "download_ms": _ms(marks.get("headers"), done),
+        "total_ms": _ms(marks.get("start"), done),
+        "reused": "reused" in marks,
+        "bytes": nbytes,
+        "encoding": encoding or "identity",
+    }
+
+class ScraperClient:
+    """
+    session aiohttp אחד לכל התהליך. החיבור נשמר בין טיקים (keep-alive), DNS נשמר ב-cache,
+    ולכל בקשה נמדדים DNS / connect / TTFB / download. המדידות האחרונות ב-metrics.
+    """
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.metrics: Deque[Dict[str, object]] = collections.deque(maxlen=getattr(config, "HTTP_METRICS_KEEP", 100))
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=getattr(config, "HTTP_POOL_SIZE", 4),
+                    keepalive_timeout=getattr(config, "HTTP_KEEPALIVE", 75),
+                    ttl_dns_cache=getattr(config, "HTTP_DNS_TTL", 300),
+                ),
+                timeout=aiohttp.ClientTimeout(
+                    connect=getattr(config, "HTTP_CONNECT_TIMEOUT", 5),
+                    sock_read=getattr(config, "HTTP_READ_TIMEOUT", 20),
+                ),
+                headers=default_headers(),
+                trace_configs=[_trace_config()],
+            )
+        return self._session
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> Fetched:
+        """GET שקורא את כל הגוף; 304 מוחזר כרגיל, 4xx/5xx זורקים ClientResponseError."""
+        marks: Dict[str, float] = {}
+        async with self._get_session().get(url, headers=headers, trace_request_ctx=marks) as resp:
+            body = await resp.read()
+            timing = _timing(marks, time.perf_counter(), len(body), resp.headers.get("Content-Encoding"))
+            self.metrics.append(timing)
+            log.debug("GET %s -> %s | %s", url, resp.status, timing)
+            resp.raise_for_status()  # 304 עובר; 4xx/5xx -> ClientResponseError
+            return Fetched(resp.status, dict(resp.headers), body, resp.charset, timing)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+_CLIENT: Optional[ScraperClient] = None
+_SESSION: Optional[requests.Session] = None
+
+def get_client() -> ScraperClient:
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = ScraperClient()
+    return _CLIENT
+
+async def close_client() -> None:
+    global _CLIENT
+    if _CLIENT is not None:
+        await _CLIENT.close()
+        _CLIENT = None
+
+def get_session() -> requests.Session:
+    """requests.Session משותף לנתיב הסינכרוני (monitor_job, כלים)."""
+    global _SESSION
+    if _SESSION is None:
+        _SESSION = requests.Session()
+        _SESSION.headers.update(default_headers())
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=getattr(config, "HTTP_POOL_SIZE", 4))
+        _SESSION.mount("https://", adapter)
+        _SESSION.mount("http://", adapter)
+    return _SESSION
+
+def sync_timeout():
+    # (connect, read) — requests מקבל tuple
+    return (getattr(config, "HTTP_CONNECT_TIMEOUT", 5), getattr(config, "HTTP_READ_TIMEOUT", 20))
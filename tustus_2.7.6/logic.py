@@ -1,10 +1,23 @@
 from __future__ import annotations
 from typing import List, Dict, Iterable, Tuple, Optional
 import re
+import asyncio
+import atexit
+import hashlib
+import json
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import requests
 from bs4 import BeautifulSoup, ResultSet
+from lxml import etree
 import config
 import db
+import http_client
+import maintenance
+import snapshots
+
+log = logging.getLogger("tustus.logic")
 
 # ---------- Public API used by handlers ----------
 
@@ -42,6 +55,23 @@ def normalize_selected_cities(raw: List[str]) -> List[Tuple[str,str]]:
 def _text(n) -> str:
     return re.sub(r"\s+", " ", (n.get_text(strip=True) if n else "")).strip()
 
+def _split_destination(destination: str) -> Tuple[str, str]:
+    # "אתונה - יוון" -> ("אתונה", "יוון")
+    if destination and "-" in destination:
+        parts = [p.strip() for p in destination.split("-", 1)]
+        if len(parts) == 2:
+            return parts[0], parts[1]
+    return "", ""
+
+def _price_and_currency(price_attr: Optional[str], currency_attr: Optional[str], price_text: str) -> Tuple[Optional[float], str]:
+    if price_attr and re.match(r"^\d+(\.\d+)?$", price_attr):
+        price_val = float(price_attr)
+    else:
+        m = re.search(r"(\d+(?:\.\d+)?)", price_text.replace(",", ""))
+        price_val = float(m.group(1)) if m else None
+    currency = currency_attr or ( "$" if "$" in price_text else "₪" if "₪" in price_text or "שח" in price_text or "ש\"ח" in price_text else "" )
+    return price_val, currency
+
 def _parse_item(div) -> Dict[str, Optional[str]]:
     # על פי חוזה ה-HTML (ראה המסמך המצורף)
     # מזהים ושדות כלליים
@@ -52,23 +82,12 @@ def _parse_item(div) -> Dict[str, Optional[str]]:
     affiliation = div.get("data_ga_affiliation") or ""
     promo_category = div.get("data_ga_item_category") or ""
     destination = div.get("data_ga_item_name") or div.get("con_desc") or ""
-    dest_city, dest_country = "", ""
-    if destination and "-" in destination:
-        parts = [p.strip() for p in destination.split("-", 1)]
-        if len(parts) == 2:
-            dest_city, dest_country = parts[0], parts[1]
+    dest_city, dest_country = _split_destination(destination)
 
     trip_title = _text(div.select_one(".show_item_name"))
     price_text = _text(div.select_one(".show_item_total_price"))
     # מחיר ומטבע
-    price_attr = div.get("data_number_ga_price")
-    price_val = None
-    if price_attr and re.match(r"^\d+(\.\d+)?$", price_attr):
-        price_val = float(price_attr)
-    else:
-        m = re.search(r"(\d+(?:\.\d+)?)", price_text.replace(",", ""))
-        price_val = float(m.group(1)) if m else None
-    currency = div.get("data_ga_currency") or ( "$" if "$" in price_text else "₪" if "₪" in price_text or "שח" in price_text or "ש\"ח" in price_text else "" )
+    price_val, currency = _price_and_currency(div.get("data_number_ga_price"), div.get("data_ga_currency"), price_text)
 
     img = div.select_one(".show_item_img img")
     img_url = img.get("src") if img else None
@@ -98,6 +117,13 @@ def _parse_item(div) -> Dict[str, Optional[str]]:
     note = _text(div.select_one(".flight_note"))
     more_like = _text(div.select_one(".more_like_this"))
 
+    # לו"ז מוקלד: התאריך ("יום ב' 01/09") הוא ה-text-gray השני ב-.from, אז מחפשים בכל הרשימה
+    typed = db.typed_schedule(
+        _text(go.select(".from .text-gray")) if go else None, out_from_time,
+        _text(bk.select(".from .text-gray")) if bk else None, back_from_time,
+        out_duration, back_duration,
+    )
+
     return {
         "item_id": item_id,
         "selapp_item": selapp_item,
@@ -131,44 +157,643 @@ def _parse_item(div) -> Dict[str, Optional[str]]:
         "note": note,
         "more_like": more_like,
         "url": config.URL,
+        **typed,
+    }
+
+# ---------- Streaming parse (lxml pull parser) ----------
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def _is_card(el) -> bool:
+    return el.tag == "div" and "show_item" in (el.get("class") or "").split()
+
+def _iter_chunks(source) -> Iterable:
+    # מקבל str/bytes שלם או איטרטור של חתיכות (למשל resp.iter_content)
+    if isinstance(source, (str, bytes)):
+        for i in range(0, len(source), STREAM_CHUNK_SIZE):
+            yield source[i:i + STREAM_CHUNK_SIZE]
+    else:
+        yield from source
+
+def _free(el) -> None:
+    # משחרר את תת-העץ שכבר עובד ואת האחים שקדמו לו, כדי שהעץ לא יגדל
+    el.clear()
+    parent = el.getparent()
+    if parent is not None:
+        while el.getprevious() is not None:
+            del parent[0]
+
+def iter_cards(source) -> Iterable:
+    """
+    מפרסר את הדף בהדרגה ומחזיר כל אלמנט .show_item ברגע שנסגר.
+    אחרי שהצרכן סיים עם הכרטיס הוא משוחרר, כך שהזיכרון חסום בגודל כרטיס אחד.
+    """
+    parser = etree.HTMLPullParser(events=("start", "end"))
+    depth = 0  # עומק בתוך כרטיס פתוח (0 = מחוץ לכרטיס)
+
+    def _drain():
+        nonlocal depth
+        for event, el in parser.read_events():
+            if event == "start":
+                if depth:
+                    depth += 1
+                elif _is_card(el):
+                    depth = 1
+                continue
+            if depth:
+                depth -= 1
+                if depth:
+                    continue
+                yield el
+            _free(el)
+
+    for chunk in _iter_chunks(source):
+        parser.feed(chunk)
+        yield from _drain()
+    parser.close()
+    yield from _drain()
+
+# ---------- Compiled selector plan (lxml XPath) ----------
+
+def _css_to_xpath(css: str) -> str:
+    # רק תת-הקבוצה שבחוזה: שרשרת צאצאים של tag ו/או .class
+    steps = []
+    for part in css.split():
+        m = re.fullmatch(r"([a-z][\w-]*)?((?:\.[\w-]+)*)", part)
+        if not m:
+            raise ValueError(f"unsupported selector: {css!r}")
+        preds = "".join(
+            f"[contains(concat(' ', normalize-space(@class), ' '), ' {c} ')]"
+            for c in m.group(2).split(".")[1:]
+        )
+        steps.append(f"descendant::{m.group(1) or '*'}{preds}")
+    return "/".join(steps)
+
+# סלקטורים מחוזה ה-HTML (html_contract.html); מקומפלים פעם אחת בעת ייבוא
+_CARD_SELECTORS = {
+    "trip_title": ".show_item_name",
+    "price_text": ".show_item_total_price",
+    "img": ".show_item_img img",
+    "badge_text": ".spcial_message_bottom",
+    "go": ".flight_go",
+    "back": ".flight_back",
+    "note": ".flight_note",
+    "more_like": ".more_like_this",
+}
+_LEG_SELECTORS = {
+    "from_gray": ".from .text-gray",
+    "from_time": ".from .flight_hourTime",
+    "to_gray": ".to .text-gray",
+    "to_time": ".to .flight_hourTime",
+    "duration": ".fligth .text-gray",
+}
+_CARD_PLAN = {k: etree.XPath(_css_to_xpath(v)) for k, v in _CARD_SELECTORS.items()}
+_LEG_PLAN = {k: etree.XPath(_css_to_xpath(v)) for k, v in _LEG_SELECTORS.items()}
+
+_WS_RE = re.compile(r"\s+")
+
+def _el_text(el) -> str:
+    # מקביל ל-get_text(strip=True) של BeautifulSoup
+    return "".join(t.strip() for t in el.itertext())
+
+def _ltext(nodes, first: bool = True) -> str:
+    """_text עבור תוצאת XPath: האלמנט הראשון, או כל הרשימה (first=False)."""
+    if not nodes:
+        return ""
+    if first:
+        return _WS_RE.sub(" ", _el_text(nodes[0])).strip()
+    return _WS_RE.sub(" ", " ".join(_el_text(el) for el in nodes)).strip()
+
+def _parse_card(el) -> Dict[str, Optional[str]]:
+    """כמו _parse_item, אבל ישירות על אלמנט lxml דרך ה-plan המקומפל."""
+    get = el.get
+    destination = get("data_ga_item_name") or get("con_desc") or ""
+    dest_city, dest_country = _split_destination(destination)
+    price_text = _ltext(_CARD_PLAN["price_text"](el))
+    price_val, currency = _price_and_currency(get("data_number_ga_price"), get("data_ga_currency"), price_text)
+    img = _CARD_PLAN["img"](el)
+
+    legs = {}
+    for leg in ("go", "back"):
+        found = _CARD_PLAN[leg](el)
+        if not found:
+            legs[leg] = dict.fromkeys(("from_city", "from_time", "from_date", "from_dates",
+                                       "to_city", "to_time", "to_date", "duration"))
+            continue
+        node = found[0]
+        from_gray = _LEG_PLAN["from_gray"](node)
+        to_gray = _LEG_PLAN["to_gray"](node)
+        # כמו ב-_parse_item: בהלוך התאריך נגזר מהאלמנט הראשון, בחזור מכל הרשימה
+        date_first = leg == "go"
+        legs[leg] = {
+            "from_city": _ltext(from_gray),
+            "from_time": _ltext(_LEG_PLAN["from_time"](node)),
+            "from_date": _ltext(from_gray, first=date_first)[1:],
+            "from_dates": _ltext(from_gray, first=False),  # עיר + תאריך, ל-typed_schedule
+            "to_city": _ltext(to_gray),
+            "to_time": _ltext(_LEG_PLAN["to_time"](node)),
+            "to_date": _ltext(to_gray, first=date_first)[1:],
+            "duration": _ltext(_LEG_PLAN["duration"](node)),
+        }
+    go, bk = legs["go"], legs["back"]
+
+    return {
+        "item_id": get("data_ga_item_id") or get("ite_item") or "",
+        "selapp_item": get("ite_selappitem") or "",
+        "category": get("category") or "",
+        "provider": get("data_ga_item_category4") or "",
+        "affiliation": get("data_ga_affiliation") or "",
+        "promo_category": get("data_ga_item_category") or "",
+        "destination": destination,
+        "dest_city": dest_city,
+        "dest_country": dest_country,
+        "trip_title": _ltext(_CARD_PLAN["trip_title"](el)),
+        "price": price_val,
+        "currency": currency,
+        "price_text": price_text,
+        "img_url": img[0].get("src") if img else None,
+        "badge_text": _ltext(_CARD_PLAN["badge_text"](el)),
+        "out_from_city": go["from_city"],
+        "out_from_date": go["from_date"],
+        "out_from_time": go["from_time"],
+        "out_to_city": go["to_city"],
+        "out_to_date": go["to_date"],
+        "out_to_time": go["to_time"],
+        "out_duration": go["duration"],
+        "back_from_city": bk["from_city"],
+        "back_from_date": bk["from_date"],
+        "back_from_time": bk["from_time"],
+        "back_to_city": bk["to_city"],
+        "back_to_date": bk["to_date"],
+        "back_to_time": bk["to_time"],
+        "back_duration": bk["duration"],
+        "note": _ltext(_CARD_PLAN["note"](el)),
+        "more_like": _ltext(_CARD_PLAN["more_like"](el)),
+        "url": config.URL,
+        **db.typed_schedule(go["from_dates"], go["from_time"], bk["from_dates"], bk["from_time"],
+                            go["duration"], bk["duration"]),
     }
 
-def scrape_items(html: str) -> List[dict]:
+def iter_items_stream(source) -> Iterable[Dict[str, Optional[str]]]:
+    for el in iter_cards(source):
+        yield _parse_card(el)
+
+# ---------- Parallel parse (process pool) ----------
+
+_DIV_OPEN_RE = re.compile(r"<div\b[^>]*>", re.IGNORECASE)
+_CLASS_ATTR_RE = re.compile(r"""\bclass\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.IGNORECASE)
+
+_POOL: Optional[ProcessPoolExecutor] = None
+
+def split_card_fragments(html: str) -> List[str]:
+    """
+    חותך את ה-HTML הגולמי לפרגמנט לכל כרטיס: מתג הפתיחה של show_item ועד תחילת הכרטיס הבא.
+    שאריות בסוף פרגמנט (תגיות סגירה, עטיפות) לא מפריעות ל-iter_cards.
+    """
+    starts = []
+    for m in _DIV_OPEN_RE.finditer(html):
+        c = _CLASS_ATTR_RE.search(m.group(0))
+        if c and "show_item" in (c.group(1) or c.group(2) or c.group(3) or "").split():
+            starts.append(m.start())
+    return [html[a:b] for a, b in zip(starts, starts[1:] + [len(html)])]
+
+def _parse_fragments(fragments: List[str]) -> List[dict]:
+    # רץ בתהליך עובד; כל פרגמנט מכיל כרטיס אחד
+    out = []
+    for frag in fragments:
+        out.extend(iter_items_stream(frag))
+    return out
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        # forkserver: לא מבצעים fork לתהליך הבוט שכבר מריץ threads (job queue, executor)
+        methods = multiprocessing.get_all_start_methods()
+        ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else None)
+        _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+    return _POOL
+
+def shutdown_pool() -> None:
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(cancel_futures=True)
+        _POOL = None
+
+atexit.register(shutdown_pool)
+
+def _parse_fragments_parallel(fragments: List[str], workers: Optional[int] = None) -> List[dict]:
+    """פרגמנטים (כרטיס לכל אחד) באצוות ל-ProcessPoolExecutor; התוצאה לפי הסדר המקורי."""
+    workers = workers or int(getattr(config, "PARSE_WORKERS", 1) or 1)
+    if workers <= 1 or len(fragments) < 2:
+        return _parse_fragments(fragments)
+    # כמה אצוות לכל עובד, כדי לאזן בלי לשלם pickle לכל כרטיס בנפרד
+    n_batches = min(len(fragments), workers * 4)
+    size = -(-len(fragments) // n_batches)
+    batches = [fragments[i:i + size] for i in range(0, len(fragments), size)]
+    items: List[dict] = []
+    for part in _get_pool(workers).map(_parse_fragments, batches):
+        items.extend(part)
+    return items
+
+def scrape_items_parallel(html: str, workers: Optional[int] = None) -> List[dict]:
+    """פרסור מקבילי: פרגמנט לכל כרטיס, אצוות ל-ProcessPoolExecutor, איחוד לפי הסדר המקורי."""
+    return _parse_fragments_parallel(split_card_fragments(html), workers)
+
+def scrape_items(html: str, mode: Optional[str] = None) -> List[dict]:
+    # mode: "stream" (ברירת מחדל, זיכרון חסום), "parallel" (ProcessPool) או "soup" (עץ BeautifulSoup מלא)
+    mode = mode or getattr(config, "SCRAPE_MODE", "stream")
+    if mode == "stream":
+        return list(iter_items_stream(html))
+    if mode == "parallel":
+        return scrape_items_parallel(html)
     soup = BeautifulSoup(html, "lxml")
     items = []
     for div in soup.select(".show_item"):
         items.append(_parse_item(div))
     return items
 
+# ---------- Card fingerprint cache ----------
+
+CardKey = Tuple[str, str]
+
+class CardScan:
+    """תוצאת סריקה אחת מול ה-cache: מה השתנה, מה לא, וסטטיסטיקה לטיק."""
+    def __init__(self, cache: "CardCache", entries: Dict[CardKey, Dict[bytes, dict]],
+                 changed: List[dict], unchanged: List[CardKey], stats: Dict[str, int]):
+        self._cache = cache
+        self.entries = entries
+        self.changed = changed
+        self.unchanged = unchanged
+        self.stats = stats
+
+    def commit(self, drop=()) -> None:
+        # נקרא רק אחרי שה-DB נכתב בהצלחה; אחרת הטיק הבא יראה את הכרטיסים כחדשים שוב.
+        # drop: מפתחות שאין להם שורה ב-DB — יפורסרו מחדש בטיק הבא
+        for key in drop:
+            self.entries.pop(key, None)
+        self._cache._entries = self.entries
+
+class CardCache:
+    """
+    cache ברמת כרטיס: (data_ga_item_id, ite_selappitem) -> {hash של ה-outer HTML: שורה מפורסרת}.
+    כרטיס שה-hash שלו לא השתנה לא עובר פרסור ולא upsert. מפתח יכול להופיע כמה פעמים
+    בעמוד (קטגוריות שונות) — לכן נשמרים כל ה-hashes שלו, והשורה האחרונה היא שנכתבת (כמו ב-upsert).
+    """
+    def __init__(self):
+        self._entries: Dict[CardKey, Dict[bytes, dict]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        self._entries = {}
+
+    def forget(self, keys) -> None:
+        # הכרטיסים האלה יפורסרו וייכתבו מחדש בפעם הבאה שיופיעו (למשל אחרי העברה לארכיון)
+        for key in keys:
+            self._entries.pop(tuple(key), None)
+
+    def scan(self, source, mode: Optional[str] = None) -> CardScan:
+        """
+        mode (ברירת מחדל config.SCRAPE_MODE) קובע איך מפורסרים כרטיסים שלא ב-cache:
+        "stream" — במקום, תוך כדי המעבר; "parallel" / "soup" — כל ה-misses באצווה אחת בסוף
+        (ב-parallel דרך ה-ProcessPool, כך שטיק ראשון על cache ריק מתחלק בין PARSE_WORKERS).
+        """
+        mode = mode or getattr(config, "SCRAPE_MODE", "stream")
+        stats = {"hit": 0, "miss": 0, "new": 0, "vanished": 0}
+        entries: Dict[CardKey, Dict[bytes, dict]] = {}
+        final: Dict[CardKey, Tuple[bytes, bool]] = {}  # key -> (fp של ההופעה האחרונה, האם פורסר מחדש)
+        pending: List[Tuple[CardKey, bytes, str]] = []  # misses לפרסור באצווה (לא stream)
+        for el in iter_cards(source):
+            key = (el.get("data_ga_item_id") or el.get("ite_item") or "", el.get("ite_selappitem") or "")
+            raw = etree.tostring(el, with_tail=False)  # ה-tail תלוי בחיתוך ה-chunks, לא בכרטיס
+            fp = hashlib.blake2b(raw, digest_size=16).digest()
+            known = self._entries.get(key)
+            row = known.get(fp) if known else None
+            if row is not None:
+                stats["hit"] += 1
+                fresh = False
+            else:
+                stats["miss" if known else "new"] += 1
+                if mode == "stream":
+                    row = _parse_card(el)
+                else:
+                    pending.append((key, fp, raw.decode("utf-8")))
+                fresh = True
+            entries.setdefault(key, {})[fp] = row
+            final.pop(key, None)  # שומר על סדר ההופעה האחרונה, כמו scrape_items
+            final[key] = (fp, fresh)
+        if pending:
+            for (key, fp, _), row in zip(pending, _parse_misses([h for _, _, h in pending], mode)):
+                entries[key][fp] = row
+        stats["vanished"] = sum(1 for k in self._entries if k not in entries)
+        changed = [entries[k][fp] for k, (fp, fresh) in final.items() if fresh]
+        unchanged = [k for k, (_, fresh) in final.items() if not fresh]
+        return CardScan(self, entries, changed, unchanged, stats)
+
+def _parse_misses(fragments: List[str], mode: str) -> List[dict]:
+    # כרטיס אחד לכל פרגמנט (outer HTML מה-scan); שורה אחת לכל פרגמנט, לפי הסדר
+    if mode == "parallel":
+        return _parse_fragments_parallel(fragments)
+    return [_parse_item(BeautifulSoup(f, "lxml").select_one(".show_item")) for f in fragments]
+
+_CARD_CACHE = CardCache()
+_FLIGHT_IMAGE = db.FlightImage()
+
+# ---------- JSON source adapter ----------
+
+# עמודת DB -> מפתחות אפשריים ב-JSON (לפי שמות ה-GA שבחוזה ה-HTML; ללא תלות ב-case)
+JSON_FIELD_KEYS: Dict[str, Tuple[str, ...]] = {
+    "item_id": ("data_ga_item_id", "item_id", "ite_item", "itemid", "id"),
+    "selapp_item": ("ite_selappitem", "selapp_item", "selappitem"),
+    "category": ("category", "categoryid"),
+    "provider": ("data_ga_item_category4", "item_category4", "provider"),
+    "affiliation": ("data_ga_affiliation", "affiliation"),
+    "promo_category": ("data_ga_item_category", "item_category", "promo_category"),
+    "destination": ("data_ga_item_name", "item_name", "con_desc", "destination"),
+    "trip_title": ("trip_title", "show_item_name", "title"),
+    "price": ("data_number_ga_price", "price"),
+    "currency": ("data_ga_currency", "currency"),
+    "price_text": ("price_text", "show_item_total_price"),
+    "img_url": ("img_url", "image", "img"),
+    "badge_text": ("badge_text", "spcial_message_bottom"),
+    "out_from_city": ("out_from_city",), "out_from_date": ("out_from_date",), "out_from_time": ("out_from_time",),
+    "out_to_city": ("out_to_city",), "out_to_date": ("out_to_date",), "out_to_time": ("out_to_time",),
+    "out_duration": ("out_duration",),
+    "back_from_city": ("back_from_city",), "back_from_date": ("back_from_date",), "back_from_time": ("back_from_time",),
+    "back_to_city": ("back_to_city",), "back_to_date": ("back_to_date",), "back_to_time": ("back_to_time",),
+    "back_duration": ("back_duration",),
+    "note": ("note", "flight_note"),
+    "more_like": ("more_like", "more_like_this"),
+}
+# תאריכי הלוך/חזור ל-typed_schedule: out_from_date הוא שם העיר בלבד (ראה _parse_card), אז הטקסט
+# של התאריך מגיע ממפתח מפורש — ISO ("2025-09-01") או הטקסט המלא של from ("תל אביב יום ב' 01/09")
+JSON_DATE_KEYS: Dict[str, Tuple[str, ...]] = {
+    "out": ("out_date", "out_from_dates", "out_from_text"),
+    "back": ("back_date", "back_from_dates", "back_from_text"),
+}
+_ISO_DATE_RE = re.compile(r"^(\d{4})-(\d{2})-(\d{2})")
+
+def _walk_json(data, depth: int = 0) -> List[dict]:
+    # מחפש את הרשימה הראשונה של אובייקטים שנראים כמו דילים (יש להם מזהה ויעד)
+    if depth > 6:
+        return []
+    if isinstance(data, list):
+        if data and all(isinstance(x, dict) for x in data) and any(_json_row(x) for x in data[:5]):
+            return data
+        for x in data:
+            found = _walk_json(x, depth + 1)
+            if found:
+                return found
+    elif isinstance(data, dict):
+        for v in data.values():
+            found = _walk_json(v, depth + 1)
+            if found:
+                return found
+    return []
+
+def _json_row(obj: dict) -> Optional[Dict[str, Optional[str]]]:
+    """ממפה פריט JSON לאותה סכמת שורה כמו _parse_card; None אם חסר מזהה או יעד."""
+    low = {str(k).lower(): v for k, v in obj.items()}
+
+    def pick(col):
+        for k in JSON_FIELD_KEYS[col]:
+            v = low.get(k)
+            if v not in (None, ""):
+                return v if isinstance(v, str) else str(v)
+        return None
+
+    item_id, destination = pick("item_id"), pick("destination")
+    if not item_id or not destination:
+        return None
+    row = {col: pick(col) for col in JSON_FIELD_KEYS}
+    for col in ("selapp_item", "category", "provider", "affiliation", "promo_category",
+                "trip_title", "price_text", "badge_text", "note", "more_like"):
+        row[col] = _WS_RE.sub(" ", row[col] or "").strip()
+    row["dest_city"], row["dest_country"] = _split_destination(destination)
+    row["price"], row["currency"] = _price_and_currency(row["price"], row["currency"], row["price_text"])
+    row["url"] = config.URL
+    dates = {}
+    for leg, keys in JSON_DATE_KEYS.items():
+        v = next((str(low[k]) for k in keys if low.get(k) not in (None, "")), None)
+        m = _ISO_DATE_RE.match(v or "")
+        dates[leg] = f"{m.group(3)}/{m.group(2)}/{m.group(1)}" if m else v or row[f"{leg}_from_date"]
+    row.update(db.typed_schedule(dates["out"], row["out_from_time"], dates["back"],
+                                 row["back_from_time"], row["out_duration"], row["back_duration"]))
+    return row
+
+def rows_from_json(body: bytes) -> List[dict]:
+    """מפענח payload של דילים. ValueError אם אינו JSON או שאין בו פריטים תקינים."""
+    items = _walk_json(json.loads(body))
+    rows = [r for r in map(_json_row, items) if r]
+    if not rows:
+        raise ValueError("no deal items in JSON payload")
+    return rows
+
+# ---------- Monitor tick ----------
+
+# source: "page" (HTML) או "json" — לכל מקור hash ו-validators משלו ב-scrape_state
+
+def _conditional_headers(conn, source: str = "page") -> Dict[str, str]:
+    # If-None-Match / If-Modified-Since לפי מה שהשרת החזיר בפעם הקודמת
+    headers: Dict[str, str] = {}
+    etag = db.get_state(conn, f"{source}_etag")
+    last_modified = db.get_state(conn, f"{source}_last_modified")
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+def _fetch(conn, url: str, source: str) -> Tuple[Optional[requests.Response], Optional[str]]:
+    """
+    GET מותנה (סינכרוני, requests).
+    מחזיר (resp, body_hash); resp=None כשהשרת ענה 304.
+    """
+    resp = http_client.get_session().get(url, timeout=http_client.sync_timeout(), headers=_conditional_headers(conn, source))
+    if resp.status_code == 304:
+        return None, None
+    resp.raise_for_status()
+    return resp, hashlib.sha256(resp.content).hexdigest()
+
+def _touch_unchanged(conn) -> int:
+    # הדף זהה לטיק הקודם: רק last_seen מתעדכן, בלי פרסור ובלי upsert
+    with conn:
+        prev_tick = db.get_state(conn, "tick_at")
+        tick_at = conn.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0]
+        n = db.touch_seen_since(conn, prev_tick) if prev_tick else 0
+        db.bump_dest_seen(conn, tick_at)
+        db.set_state(conn, "tick_at", tick_at)
+    return n
+
+def _parse_page(html: str) -> Tuple[List[dict], List[CardKey], Optional[CardScan]]:
+    """CPU בלבד, בלי DB: (שורות לכתיבה, מפתחות שלא השתנו, scan לאישור אחרי הכתיבה)."""
+    if getattr(config, "CARD_CACHE", True):
+        scan = _CARD_CACHE.scan(html)
+        log.info("card cache: hit=%(hit)d miss=%(miss)d new=%(new)d vanished=%(vanished)d", scan.stats)
+        return scan.changed, scan.unchanged, scan
+    return scrape_items(html), [], None
+
+def _archive_page(body: bytes, page_hash: str) -> None:
+    # snapshot דחוס לפי hash (snapshots.py); כשל בארכיון לא מפיל את הטיק
+    store = snapshots.get_store()
+    if store is None:
+        return
+    try:
+        store.put(body, page_hash)
+    except Exception as e:
+        log.warning("snapshot archive failed: %s", e)
+
+def _write_tick(conn, source: str, body_hash: str, validators: Dict[str, Optional[str]],
+                items: List[dict], unchanged: List[CardKey]) -> Tuple[int, int, List[CardKey]]:
+    """
+    כותב רק את מה שבאמת השתנה (diff מול _FLIGHT_IMAGE); השאר מקבלות last_seen במשפט אחד.
+    שינויי מחיר/מטבע/badge/לו"ז נרשמים ב-flight_history יחד עם השורות.
+    הכתיבה בטרנזקציות קצרות של DB_WRITE_BATCH שורות; ה-hash וה-validators נשמרים רק בסוף,
+    כך שטיק שנקטע באמצע פשוט יחזור על עצמו (upsert אידמפוטנטי).
+    מחזיר (inserted, updated, מפתחות "ללא שינוי" שחסרים ב-DB).
+    """
+    _FLIGHT_IMAGE.load(conn)
+    diff = _FLIGHT_IMAGE.diff(items, unchanged)
+    batch = max(1, int(getattr(config, "DB_WRITE_BATCH", 500)))
+    history = getattr(config, "HISTORY_ENABLED", True)
+    tick_at = conn.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0]
+    ins = upd = hist = touched = 0
+    for i in range(0, len(diff.changed), batch):
+        chunk = diff.changed[i:i + batch]
+        with conn:
+            before = db.history_before(conn, chunk) if history else {}
+            n_ins, n_upd = db.upsert_flights(conn, chunk)
+            entries = _FLIGHT_IMAGE.entries_for(conn, chunk)
+            if history:
+                hist += db.record_history(conn, chunk, before, {k: v[0] for k, v in entries.items()})
+        _FLIGHT_IMAGE.update(entries)
+        ins, upd = ins + n_ins, upd + n_upd
+    for i in range(0, len(diff.touch_ids), batch * 20):  # UPDATE של last_seen זול בהרבה מ-upsert
+        with conn:
+            touched += db.touch_ids(conn, diff.touch_ids[i:i + batch * 20])
+    with conn:
+        db.bump_dest_seen(conn, tick_at)
+        db.set_state(conn, "tick_at", tick_at)
+        db.set_state(conn, f"{source}_hash", body_hash)
+        db.set_state(conn, f"{source}_etag", validators.get("ETag"))
+        db.set_state(conn, f"{source}_last_modified", validators.get("Last-Modified"))
+    log.info("db diff (%s): written=%d (ins=%d upd=%d) touched=%d missing=%d history=%d",
+             source, len(diff.changed), ins, upd, touched, len(diff.missing), hist)
+    return ins, upd, diff.missing
+
+def _monitor_json(conn) -> Optional[Tuple[int, int]]:
+    # None = אין JSON שמיש בטיק הזה, ממשיכים ל-HTML
+    url = getattr(config, "DEALS_JSON_URL", "")
+    if not url:
+        return None
+    try:
+        resp, body_hash = _fetch(conn, url, "json")
+        if resp is None or body_hash == db.get_state(conn, "json_hash"):
+            n = _touch_unchanged(conn)
+            log.info("json unchanged | last_seen touched=%d", n)
+            return 0, 0
+        rows = rows_from_json(resp.content)
+    except Exception as e:
+        log.warning("json source failed, falling back to HTML: %s", e)
+        return None
+    ins, upd, _ = _write_tick(conn, "json", body_hash, resp.headers, rows, [])
+    return ins, upd
+
 def monitor_job(conn, app=None) -> Tuple[int, int]:
     """
     מושך את הדף, מפרש לפי חוזה ה-HTML, ומעדכן/מכניס שורות.
+    אם מוגדר config.DEALS_JSON_URL — קודם מנסה את ה-JSON, ונופל ל-HTML אם הוא חסר/פגום.
+    אם הדף לא השתנה (304 או אותו hash) — רק last_seen מתעדכן.
     מחזיר (inserted, updated).
+    גרסה סינכרונית לכלים ולסקריפטים; הבוט משתמש ב-run_monitor.
     """
-    resp = requests.get(config.URL, timeout=getattr(config, "REQUEST_TIMEOUT", 15), headers={"User-Agent": getattr(config, "USER_AGENT", "Mozilla/5.0")})
-    resp.raise_for_status()
-    items = scrape_items(resp.text)
+    res = _monitor_json(conn)
+    if res is not None:
+        return res
+    resp, page_hash = _fetch(conn, config.URL, "page")
+    if resp is None or page_hash == db.get_state(conn, "page_hash"):
+        n = _touch_unchanged(conn)
+        log.info("page unchanged (%s) | last_seen touched=%d", "304" if resp is None else "same hash", n)
+        return 0, 0
+    _archive_page(resp.content, page_hash)
+    items, unchanged, scan = _parse_page(resp.text)
+    ins, upd, missing = _write_tick(conn, "page", page_hash, resp.headers, items, unchanged)
+    if scan is not None:
+        scan.commit(drop=missing)
+    return ins, upd
 
-    ins = upd = 0
-    with conn:
-        for row in items:
-            # נסיון ראשוני לבדוק אם קיים
-            exists = conn.execute(
-                "SELECT 1 FROM flights WHERE item_id=? AND selapp_item=?",
-                (row["item_id"], row["selapp_item"])
-            ).fetchone()
-            db.upsert_flight(conn, row)
-            if exists:
-                upd += 1
-            else:
-                ins += 1
+# ---------- Async pipeline (used by the bot) ----------
+
+def _fetch_state(conn, source: str) -> Tuple[Dict[str, str], Optional[str]]:
+    return _conditional_headers(conn, source), db.get_state(conn, f"{source}_hash")
+
+async def _fetch_async(url: str, headers: Dict[str, str]) -> Tuple[Optional[http_client.Fetched], Optional[str], Dict[str, Optional[str]]]:
+    """מחזיר (res, body_hash, validators); res=None כשהשרת ענה 304."""
+    res = await http_client.get_client().get(url, headers=headers)
+    log.info("fetch %s | dns=%s connect=%s ttfb=%s download=%s ms | reused=%s | %d bytes (%s)",
+             res.status, res.timing["dns_ms"], res.timing["connect_ms"], res.timing["ttfb_ms"],
+             res.timing["download_ms"], res.timing["reused"], res.timing["bytes"], res.timing["encoding"])
+    if res.status == 304:
+        return None, None, {}
+    validators = {k: res.headers.get(k) for k in ("ETag", "Last-Modified")}
+    return res, hashlib.sha256(res.body).hexdigest(), validators
+
+async def _run_monitor_json(writer: db.DbWriter) -> Optional[Tuple[int, int]]:
+    url = getattr(config, "DEALS_JSON_URL", "")
+    if not url:
+        return None
+    try:
+        headers, prev_hash = await writer.call(_fetch_state, "json")
+        res, body_hash, validators = await _fetch_async(url, headers)
+        if res is None or body_hash == prev_hash:
+            n = await writer.call(_touch_unchanged)
+            log.info("json unchanged | last_seen touched=%d", n)
+            return 0, 0
+        rows = rows_from_json(res.body)
+    except Exception as e:
+        log.warning("json source failed, falling back to HTML: %s", e)
+        return None
+    ins, upd, _ = await writer.call(_write_tick, "json", body_hash, validators, rows, [])
+    log.info("monitor tick (json): inserted=%d updated=%d", ins, upd)
     return ins, upd
 
-# נוח לאפליקציה שקוראת Async
-async def run_monitor(conn, app=None):
-    # כדי להימנע מבעיות thread, כאן מריצים סינכרוני; הקריאה מה־app צריכה להזרים conn מאותו thread.
-    return monitor_job(conn, app)
+async def run_monitor(writer: db.DbWriter, app=None) -> Tuple[int, int]:
+    """
+    אותו טיק כמו monitor_job, בלי לחסום את ה-event loop:
+    הורדה ב-aiohttp, פרסור ב-executor, וכל עבודת ה-DB ב-thread הכתיבה של writer.
+    """
+    res = await _run_monitor_json(writer)
+    if res is not None:
+        return res
+    loop = asyncio.get_running_loop()
+    headers, prev_hash = await writer.call(_fetch_state, "page")
+    fetched, page_hash, validators = await _fetch_async(config.URL, headers)
+    if fetched is None or page_hash == prev_hash:
+        n = await writer.call(_touch_unchanged)
+        log.info("page unchanged (%s) | last_seen touched=%d", "304" if fetched is None else "same hash", n)
+        return 0, 0
+    html = fetched.body.decode(fetched.charset or "utf-8", errors="replace")
+    archived = loop.run_in_executor(None, _archive_page, fetched.body, page_hash)
+    items, unchanged, scan = await loop.run_in_executor(None, _parse_page, html)
+    await archived
+    ins, upd, missing = await writer.call(_write_tick, "page", page_hash, validators, items, unchanged)
+    if scan is not None:
+        scan.commit(drop=missing)
+    log.info("monitor tick: inserted=%d updated=%d unchanged=%d", ins, upd, len(unchanged))
+    return ins, upd
+
+def run_maintenance(conn) -> dict:
+    """maintenance.run_maintenance; רץ ב-thread הכתיבה (writer.call). המפתחות שהועברו ב-"archived_keys"."""
+    return maintenance.run_maintenance(conn)
 
+def forget_archived(keys) -> None:
+    """
+    מנקה מה-caches שורות שעברו לארכיון, כדי שטיסה שחוזרת לאתר תיכתב מחדש ל-flights.
+    נקרא בצד המוניטור, תחת אותה נעילה של הטיק — לא במקביל ל-CardCache.scan או ל-_write_tick.
+    """
+    _FLIGHT_IMAGE.forget(keys)
+    _CARD_CACHE.forget(keys)
 
 def _text(n):
     """Accept element OR list/ResultSet; return normalized text."""
@@ -186,48 +811,14 @@ def _text(n):
 
 
 def get_dest_summary(conn, limit=50):
-    """Return [(destination, count)], total_count for current flights."""
-    cur = conn.cursor()
-    cur.execute("""        SELECT destination, COUNT(*) AS cnt
-        FROM flights
-        GROUP BY destination
-        ORDER BY cnt DESC, destination ASC
-        LIMIT ?
-    """, (limit,))
-    rows = cur.fetchall()
-    cur.execute("SELECT COUNT(*) FROM flights")
-    total = cur.fetchone()[0]
-    return rows, total
+    """Return [(destination, count)], total_count for current flights (from dest_stats)."""
+    return db.dest_summary(conn, limit)
 
 
 def get_dest_rows_for_keyboard(conn):
     """
     החזרת נתונים למקלדת היעדים בפורמט:
         [(city:str, country:str, count:int), ...]
-    משתמש בעמודות flights.dest_city ו-flights.dest_country אם קיימות; אחרת נופל ל-destination.
+    עיר/מדינה הן dest_city_key/dest_country_key (dest_city או destination, אחרי TRIM).
     """
-    cur = conn.cursor()
-    # נעדיף עיר/מדינה אם יש, אחרת נתרגם מ-destination לשדה city (ונשאיר country ריק)
-    try:
-        cur.execute("""
-            SELECT
-                COALESCE(NULLIF(TRIM(dest_city), ''), COALESCE(NULLIF(TRIM(destination), ''), 'יעד לא ידוע')) AS city,
-                COALESCE(NULLIF(TRIM(dest_country), ''), '') AS country,
-                COUNT(*) AS cnt
-            FROM flights
-            GROUP BY city, country
-            ORDER BY country ASC, city ASC
-        """)
-    except Exception:
-        # Fallback לגירסאות ישנות
-        cur.execute("""
-            SELECT
-                COALESCE(NULLIF(TRIM(destination), ''), 'יעד לא ידוע') AS city,
-                '' AS country,
-                COUNT(*) AS cnt
-            FROM flights
-            GROUP BY city
-            ORDER BY city ASC
-        """)
-    return cur.fetchall()
-
+    return db.dest_rows(conn)
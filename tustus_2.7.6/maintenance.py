@@ -0,0 +1,122 @@
+# maintenance.py
+# תחזוקת flights.db מחוץ לטיקים: העברת שורות ישנות לארכיון, דילול היסטוריה,
+# checkpoint ל-WAL, incremental vacuum ודוח גדלים.
+#
+# הבוט מריץ את run_maintenance פעם ביום (app._job_maintenance) ב-thread הכתיבה, תחת נעילת המוניטור.
+# ידנית (גם כשהבוט רץ — הוא מזהה את הארכוב דרך archive_gen ב-scrape_state):
+#   python maintenance.py report
+#   python maintenance.py run --archive-days 14
+from __future__ import annotations
+import argparse, json, logging, os, sqlite3, time
+from typing import Dict, List, Optional, Tuple
+
+import config
+import db
+
+log = logging.getLogger("tustus.maintenance")
+
+def _flight_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+
+def archive_stale(conn: sqlite3.Connection, days: float) -> List[db.FlightKey]:
+    """
+    מעביר ל-flights_archive שורות שלא נראו days ימים; מחזיר את המפתחות שהועברו.
+    השורה עם ה-id הגבוה ביותר לא מועברת לעולם: כך SQLite לא ממחזר ids, ו-flight_history
+    של טיסה בארכיון לא מתערבב עם טיסה חדשה.
+    dest_stats מתעדכנת מעצמה (trigger המחיקה). באותה טרנזקציה מתקדם db.ARCHIVE_GEN_KEY, כך שבוט
+    שרץ בתהליך אחר טוען מחדש את FlightImage בטיק הבא ולא "נוגע" ב-ids שכבר לא ב-flights.
+    """
+    cutoff = f"-{float(days)} days"
+    archive_cols = set(_flight_columns(conn, "flights_archive"))
+    cols = ",".join(c for c in _flight_columns(conn, "flights") if c in archive_cols and c != "archived_at")
+    where = "last_seen < datetime('now', ?) AND id < (SELECT MAX(id) FROM flights)"
+    with conn:
+        keys = [(r[0], r[1]) for r in conn.execute(f"SELECT item_id, selapp_item FROM flights WHERE {where}", (cutoff,))]
+        if not keys:
+            return []
+        conn.execute(f"INSERT INTO flights_archive({cols}, archived_at) "
+                     f"SELECT {cols}, CURRENT_TIMESTAMP FROM flights WHERE {where}", (cutoff,))
+        conn.execute(f"DELETE FROM flights WHERE {where}", (cutoff,))
+        db.set_state(conn, db.ARCHIVE_GEN_KEY, str(int(db.get_state(conn, db.ARCHIVE_GEN_KEY) or 0) + 1))
+    return keys
+
+def checkpoint(conn: sqlite3.Connection) -> Tuple[int, int, int]:
+    # (busy, דפים ב-WAL, דפים שהועברו); busy=1 = קורא החזיק snapshot וה-WAL לא קוצץ
+    return tuple(conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone())
+
+def incremental_vacuum(conn: sqlite3.Connection, pages: int = 0) -> int:
+    """
+    מחזיר דפים פנויים למערכת הקבצים. בפעם הראשונה ממיר את הקובץ ל-auto_vacuum=INCREMENTAL
+    (דורש VACUUM מלא אחד); אחר כך רק incremental_vacuum. מחזיר כמה דפים שוחררו.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        t0 = time.perf_counter()
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        log.info("converted DB to auto_vacuum=INCREMENTAL (full VACUUM %.1fs)", time.perf_counter() - t0)
+        return 0
+    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    conn.execute(f"PRAGMA incremental_vacuum({int(pages)})" if pages else "PRAGMA incremental_vacuum")
+    return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+def report(conn: sqlite3.Connection) -> Dict[str, object]:
+    """גודל הקובץ, ה-WAL, דפים פנויים ומספר שורות בטבלאות העיקריות."""
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    wal = f"{path}-wal" if path else ""
+    out: Dict[str, object] = {
+        "db_bytes": conn.execute("PRAGMA page_count").fetchone()[0] * page_size,
+        "wal_bytes": os.path.getsize(wal) if wal and os.path.exists(wal) else 0,
+        "freelist_pages": conn.execute("PRAGMA freelist_count").fetchone()[0],
+        "page_size": page_size,
+    }
+    for table in ("flights", "flights_archive", "flight_history", "dest_stats"):
+        out[f"{table}_rows"] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    return out
+
+def run_maintenance(conn: sqlite3.Connection, archive_days: Optional[float] = None) -> Dict[str, object]:
+    """
+    סבב תחזוקה מלא. רץ על חיבור הכתיבה (db.DbWriter), כך שלא מתנגש בכתיבות של הטיק.
+    מחזיר דוח; המפתחות שהועברו לארכיון ב-"archived_keys" (הקורא מנקה איתם את ה-caches).
+    """
+    t0 = time.perf_counter()
+    days = archive_days if archive_days is not None else getattr(config, "ARCHIVE_AFTER_DAYS", 14)
+    before = report(conn)
+    keys = archive_stale(conn, days) if days else []
+    hist = (0, 0)
+    if getattr(config, "HISTORY_ENABLED", True):
+        hist = db.compact_history(conn, getattr(config, "HISTORY_KEEP_FULL_DAYS", 30),
+                                  int(getattr(config, "HISTORY_BUCKET_HOURS", 24) * 3600))
+    conn.execute("PRAGMA optimize")
+    freed = incremental_vacuum(conn, getattr(config, "MAINT_VACUUM_PAGES", 0))
+    ckpt = checkpoint(conn)  # אחרון: גם דפי ה-vacuum עוברים לקובץ וה-WAL מקוצץ
+    after = report(conn)
+    log.info("maintenance: archived=%d history %d->%d checkpoint=%s freed_pages=%d | "
+             "db %.1fMB -> %.1fMB, wal %.1fMB -> %.1fMB, freelist %d -> %d | %.1fs",
+             len(keys), hist[0], hist[1], ckpt, freed,
+             before["db_bytes"] / 2**20, after["db_bytes"] / 2**20,
+             before["wal_bytes"] / 2**20, after["wal_bytes"] / 2**20,
+             before["freelist_pages"], after["freelist_pages"], time.perf_counter() - t0)
+    return {"before": before, "after": after, "archived": len(keys), "archived_keys": keys,
+            "history": hist, "checkpoint": ckpt, "freed_pages": freed}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="flights.db maintenance")
+    ap.add_argument("--db", default=None, help="DB path (default: config.DB_PATH)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("report")
+    p_run = sub.add_parser("run")
+    p_run.add_argument("--archive-days", type=float, default=None)
+    args = ap.parse_args(argv)
+    conn = db.get_conn(args.db)
+    db.migrate(conn)
+    if args.cmd == "report":
+        print(json.dumps(report(conn), indent=2))
+    elif args.cmd == "run":
+        res = run_maintenance(conn, args.archive_days)
+        res.pop("archived_keys")
+        print(json.dumps(res, indent=2))
+    conn.close()
+
+if __name__ == "__main__":
+    main()
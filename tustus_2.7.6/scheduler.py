@@ -0,0 +1,44 @@
+# scheduler.py
+# מרווח סריקה אדפטיבי: מתקצר כשהדף משתנה, מתארך כשהוא סטטי, ו-backoff אקספוננציאלי על שגיאות HTTP
+from __future__ import annotations
+import random
+from typing import Optional
+
+import config
+
+class AdaptiveInterval:
+    """
+    מחשב את ההשהיה עד הטיק הבא לפי תוצאת הטיק האחרון.
+    - שינוי בדף: המרווח מוכפל ב-speedup (ברירת מחדל ½) עד min_s.
+    - דף זהה: המרווח מוכפל ב-slowdown עד max_s.
+    - שגיאת HTTP: base * 2^errors עד backoff_max; הצלחה מאפסת את המונה.
+    על כל השהיה מופעל jitter של ±jitter (יחסי), ואחריו חיתוך לגבולות.
+    """
+    def __init__(self, base: Optional[float] = None, min_s: Optional[float] = None, max_s: Optional[float] = None,
+                 jitter: Optional[float] = None, backoff_max: Optional[float] = None,
+                 speedup: float = 0.5, slowdown: float = 1.25, rng: Optional[random.Random] = None):
+        self.base = float(base if base is not None else getattr(config, "INTERVAL", 60))
+        self.min_s = float(min_s if min_s is not None else getattr(config, "MONITOR_MIN_INTERVAL", 20))
+        self.max_s = float(max_s if max_s is not None else getattr(config, "MONITOR_MAX_INTERVAL", 300))
+        self.jitter = float(jitter if jitter is not None else getattr(config, "MONITOR_JITTER", 0.1))
+        self.backoff_max = float(backoff_max if backoff_max is not None else getattr(config, "MONITOR_BACKOFF_MAX", 900))
+        self.speedup = speedup
+        self.slowdown = slowdown
+        self.current = min(max(self.base, self.min_s), self.max_s)
+        self.errors = 0
+        self._rng = rng or random.Random()
+
+    def next_delay(self, changed: bool = False, error: bool = False) -> float:
+        if error:
+            self.errors += 1
+            delay = min(self.backoff_max, self.current * 2 ** self.errors)
+            return self._jittered(delay, lo=self.min_s, hi=self.backoff_max)
+        self.errors = 0
+        factor = self.speedup if changed else self.slowdown
+        self.current = min(max(self.current * factor, self.min_s), self.max_s)
+        return self._jittered(self.current, lo=self.min_s, hi=self.max_s)
+
+    def _jittered(self, delay: float, lo: float, hi: float) -> float:
+        if self.jitter:
+            delay *= self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+        return min(max(delay, lo), hi)
@@ -1,40 +1,218 @@
--- flights table: אין שום ON CONFLICT כאן. רק סכימה נקייה.
+-- schema.sql — נוצר מ-db.MIGRATIONS (PRAGMA user_version=8); לא לערוך ידנית.
+-- python db.py schema > schema.sql
+
+-- v1: flights + scrape_state
 CREATE TABLE IF NOT EXISTS flights (
-  id            INTEGER PRIMARY KEY AUTOINCREMENT,
-  item_id       TEXT,                 -- data-ga item id
-  selapp_item   TEXT,                 -- ite_selappitem
-  destination   TEXT NOT NULL,        -- "אתונה - יוון" / "טיסה לאתונה" מפורק בלוגיקה
-  city          TEXT,
-  country       TEXT,
-  price         REAL,
-  currency      TEXT,
-  price_raw     TEXT,                 -- למשל "$150"
-  url           TEXT,
-  img_url       TEXT,
-  last_spots    INTEGER,              -- "5 מקומות אחרונים" אם קיים
-  depart_city   TEXT,
-  depart_time   TEXT,
-  depart_date   TEXT,
-  arrive_city   TEXT,
-  arrive_time   TEXT,
-  arrive_date   TEXT,
-  return_depart_city TEXT,
-  return_depart_time TEXT,
-  return_depart_date TEXT,
-  return_arrive_city TEXT,
-  return_arrive_time TEXT,
-  return_arrive_date TEXT,
-  duration_go   TEXT,                 -- "2:10"
-  duration_back TEXT,                 -- "1:50"
-  ga_currency   TEXT,                 -- data_ga_currency
-  ga_brand      TEXT,                 -- data_ga_item_brand
-  ga_category   TEXT,                 -- data_ga_item_category
-  ga_category2  TEXT,                 -- data_ga_item_category2
-  ga_category4  TEXT,                 -- data_ga_item_category4
-  updated_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-  last_seen     TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    id INTEGER PRIMARY KEY,
+    item_id TEXT,
+    selapp_item TEXT,
+    category TEXT,
+    provider TEXT,
+    affiliation TEXT,
+    promo_category TEXT,
+    destination TEXT,
+    dest_city TEXT,
+    dest_country TEXT,
+    trip_title TEXT,
+    price REAL,
+    currency TEXT,
+    price_text TEXT,
+    img_url TEXT,
+    badge_text TEXT,
+
+    out_from_city TEXT,
+    out_from_date TEXT,
+    out_from_time TEXT,
+    out_to_city   TEXT,
+    out_to_date   TEXT,
+    out_to_time   TEXT,
+    out_duration  TEXT,
+
+    back_from_city TEXT,
+    back_from_date TEXT,
+    back_from_time TEXT,
+    back_to_city   TEXT,
+    back_to_date   TEXT,
+    back_to_time   TEXT,
+    back_duration  TEXT,
+
+    note TEXT,
+    more_like TEXT,
+    url  TEXT,
+
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_seen  TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    UNIQUE(item_id, selapp_item)
 );
 
--- אינדקס ייחודי עבור UPSERT בקוד פייתון:
-CREATE UNIQUE INDEX IF NOT EXISTS uq_flights_ids
-  ON flights(item_id, selapp_item);
+CREATE INDEX IF NOT EXISTS ix_flights_city_country ON flights(dest_country, dest_city);
+CREATE INDEX IF NOT EXISTS ix_flights_last_seen    ON flights(last_seen);
+CREATE INDEX IF NOT EXISTS ix_flights_price        ON flights(price);
+
+-- מצב הסורק בין ריצות (hash אחרון, ETag/Last-Modified, זמן טיק)
+CREATE TABLE IF NOT EXISTS scrape_state (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+
+-- v2: flight_history
+-- היסטוריית שינויים append-only: שורה לכל שינוי תוכן של טיסה (ראה record_history)
+CREATE TABLE IF NOT EXISTS flight_history (
+    flight_id   INTEGER NOT NULL,   -- flights.id
+    ts          INTEGER NOT NULL,   -- epoch seconds
+    changed     INTEGER NOT NULL,   -- ביטים: HIST_PRICE | HIST_CURRENCY | HIST_BADGE | HIST_SCHEDULE
+    price       REAL,               -- תמיד: המחיר אחרי השינוי
+    price_delta REAL,               -- רק כשהמחיר השתנה (שלילי = ירידה)
+    currency    TEXT,               -- שאר השדות רק כשהם השתנו, אחרת NULL
+    badge_text  TEXT,
+    schedule    TEXT,
+    PRIMARY KEY (flight_id, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_history_drops ON flight_history(ts) WHERE price_delta < 0;
+
+-- v3: normalized destination keys
+-- מפתחות יעד מנורמלים, נכתבים ב-upsert (dest_keys); עמודות רגילות ולא generated,
+-- כי SQLite לא מחשיב אינדקס על עמודה generated כ-covering
+ALTER TABLE flights ADD COLUMN dest_city_key TEXT;
+ALTER TABLE flights ADD COLUMN dest_country_key TEXT;
+UPDATE flights SET
+    dest_city_key = COALESCE(NULLIF(TRIM(dest_city), ''), NULLIF(TRIM(destination), ''), 'יעד לא ידוע'),
+    dest_country_key = COALESCE(TRIM(dest_country), '');
+DROP INDEX IF EXISTS ix_flights_city_country;
+CREATE INDEX IF NOT EXISTS ix_flights_dest_key ON flights(dest_country_key, dest_city_key, dest_city);
+
+-- v4: dest_stats
+-- אגרגט יעדים ממומש: שורה לכל (מדינה, עיר), מתוחזק ע"י triggers על flights.
+-- המקלדת והסיכום קוראים מכאן ב-O(יעדים), בלי GROUP BY על כל הטבלה
+CREATE TABLE IF NOT EXISTS dest_stats (
+    country     TEXT NOT NULL,      -- dest_country_key
+    city        TEXT NOT NULL,      -- dest_city_key
+    destination TEXT,               -- תווית לתצוגה (destination של השורה האחרונה שנכתבה)
+    cnt         INTEGER NOT NULL DEFAULT 0,
+    min_price   REAL,
+    last_seen   TIMESTAMP,
+    PRIMARY KEY (country, city)
+) WITHOUT ROWID;
+
+INSERT OR REPLACE INTO dest_stats(country, city, destination, cnt, min_price, last_seen)
+SELECT COALESCE(dest_country_key, ''), COALESCE(dest_city_key, 'יעד לא ידוע'),
+       MAX(destination), COUNT(*), MIN(price), MAX(last_seen)
+FROM flights GROUP BY 1, 2;
+
+CREATE TRIGGER IF NOT EXISTS trg_dest_stats_ins AFTER INSERT ON flights BEGIN
+    INSERT INTO dest_stats(country, city, destination, cnt, min_price, last_seen)
+    VALUES (COALESCE(NEW.dest_country_key, ''), COALESCE(NEW.dest_city_key, 'יעד לא ידוע'),
+            NEW.destination, 1, NEW.price, NEW.last_seen)
+    ON CONFLICT(country, city) DO UPDATE SET
+        cnt = cnt + 1,
+        destination = excluded.destination,
+        min_price = MIN(COALESCE(min_price, excluded.min_price), COALESCE(excluded.min_price, min_price)),
+        last_seen = MAX(COALESCE(last_seen, ''), COALESCE(excluded.last_seen, ''));
+END;
+
+-- AFTER: ה-MIN מחושב מחדש בלי השורה שנמחקה, ורק כשהיא הייתה המינימום
+CREATE TRIGGER IF NOT EXISTS trg_dest_stats_del AFTER DELETE ON flights BEGIN
+    UPDATE dest_stats SET
+        cnt = cnt - 1,
+        min_price = CASE WHEN OLD.price <= min_price THEN
+            (SELECT MIN(price) FROM flights
+             WHERE dest_country_key = OLD.dest_country_key AND dest_city_key = OLD.dest_city_key)
+            ELSE min_price END
+    WHERE country = COALESCE(OLD.dest_country_key, '') AND city = COALESCE(OLD.dest_city_key, 'יעד לא ידוע');
+    DELETE FROM dest_stats
+    WHERE country = COALESCE(OLD.dest_country_key, '') AND city = COALESCE(OLD.dest_city_key, 'יעד לא ידוע')
+      AND cnt <= 0;
+END;
+
+-- שינוי יעד/מחיר: יציאה מהיעד הישן (כמו delete) וכניסה לחדש (כמו insert)
+CREATE TRIGGER IF NOT EXISTS trg_dest_stats_upd AFTER UPDATE OF dest_country_key, dest_city_key, price ON flights
+WHEN OLD.dest_country_key IS NOT NEW.dest_country_key OR OLD.dest_city_key IS NOT NEW.dest_city_key
+     OR OLD.price IS NOT NEW.price
+BEGIN
+    UPDATE dest_stats SET
+        cnt = cnt - 1,
+        min_price = CASE WHEN OLD.price <= min_price THEN
+            (SELECT MIN(price) FROM flights
+             WHERE dest_country_key = OLD.dest_country_key AND dest_city_key = OLD.dest_city_key
+               AND id <> NEW.id)
+            ELSE min_price END
+    WHERE country = COALESCE(OLD.dest_country_key, '') AND city = COALESCE(OLD.dest_city_key, 'יעד לא ידוע');
+    DELETE FROM dest_stats
+    WHERE country = COALESCE(OLD.dest_country_key, '') AND city = COALESCE(OLD.dest_city_key, 'יעד לא ידוע')
+      AND cnt <= 0;
+    INSERT INTO dest_stats(country, city, destination, cnt, min_price, last_seen)
+    VALUES (COALESCE(NEW.dest_country_key, ''), COALESCE(NEW.dest_city_key, 'יעד לא ידוע'),
+            NEW.destination, 1, NEW.price, NEW.last_seen)
+    ON CONFLICT(country, city) DO UPDATE SET
+        cnt = cnt + 1,
+        destination = excluded.destination,
+        min_price = MIN(COALESCE(min_price, excluded.min_price), COALESCE(excluded.min_price, min_price)),
+        last_seen = MAX(COALESCE(last_seen, ''), COALESCE(excluded.last_seen, ''));
+END;
+
+-- last_seen של היעד לא מתוחזק ב-trigger (היה רץ על כל שורה בכל טיק) — ראה bump_dest_seen
+
+-- v5: flights_archive
+-- שורות שלא נראו ARCHIVE_AFTER_DAYS ימים עוברות לכאן (maintenance.archive_stale),
+-- כך ש-flights נשארת בגודל של מה שבאמת באתר. id נשמר (flight_history מפנה אליו)
+CREATE TABLE IF NOT EXISTS flights_archive AS SELECT * FROM flights WHERE 0;
+ALTER TABLE flights_archive ADD COLUMN archived_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS ix_archive_key ON flights_archive(item_id, selapp_item);
+
+-- v6: flights_fts
+-- חיפוש טקסט חופשי (/search): FTS5 עם external content על flights — הטקסט לא משוכפל,
+-- רק האינדקס. unicode61 מפרק עברית ואנגלית ומסיר ניקוד; prefix מאיץ "אתו*".
+-- flights_archive לא מאונדקס: /search מחפש רק בטיסות שעדיין באתר
+CREATE VIRTUAL TABLE IF NOT EXISTS flights_fts USING fts5(
+    destination, dest_city, dest_country, trip_title, note,
+    content='flights', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+INSERT INTO flights_fts(flights_fts) VALUES('rebuild');
+
+CREATE TRIGGER IF NOT EXISTS trg_fts_ins AFTER INSERT ON flights BEGIN
+    INSERT INTO flights_fts(rowid, destination, dest_city, dest_country, trip_title, note)
+    VALUES (NEW.id, NEW.destination, NEW.dest_city, NEW.dest_country, NEW.trip_title, NEW.note);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_fts_del AFTER DELETE ON flights BEGIN
+    INSERT INTO flights_fts(flights_fts, rowid, destination, dest_city, dest_country, trip_title, note)
+    VALUES ('delete', OLD.id, OLD.destination, OLD.dest_city, OLD.dest_country, OLD.trip_title, OLD.note);
+END;
+-- ה-upsert כותב את כל העמודות; האינדקס מתעדכן רק כשאחד מהשדות המאונדקסים באמת השתנה
+CREATE TRIGGER IF NOT EXISTS trg_fts_upd AFTER UPDATE OF destination, dest_city, dest_country, trip_title, note ON flights
+WHEN OLD.destination IS NOT NEW.destination OR OLD.dest_city IS NOT NEW.dest_city
+     OR OLD.dest_country IS NOT NEW.dest_country OR OLD.trip_title IS NOT NEW.trip_title
+     OR OLD.note IS NOT NEW.note
+BEGIN
+    INSERT INTO flights_fts(flights_fts, rowid, destination, dest_city, dest_country, trip_title, note)
+    VALUES ('delete', OLD.id, OLD.destination, OLD.dest_city, OLD.dest_country, OLD.trip_title, OLD.note);
+    INSERT INTO flights_fts(rowid, destination, dest_city, dest_country, trip_title, note)
+    VALUES (NEW.id, NEW.destination, NEW.dest_city, NEW.dest_country, NEW.trip_title, NEW.note);
+END;
+
+-- v7: typed schedule columns
+-- לו"ז מוקלד (TYPED_SCHEDULE_COLS), נכתב ע"י המפענח. סינון לפי טווח תאריכים / אורך טיול
+-- הוא סריקת טווח על אינדקס, במקום julianday() על כל שורה
+ALTER TABLE flights ADD COLUMN out_date DATE;
+ALTER TABLE flights ADD COLUMN back_date DATE;
+ALTER TABLE flights ADD COLUMN out_dep_min INTEGER;
+ALTER TABLE flights ADD COLUMN back_dep_min INTEGER;
+ALTER TABLE flights ADD COLUMN trip_days INTEGER;
+ALTER TABLE flights ADD COLUMN out_duration_min INTEGER;
+ALTER TABLE flights ADD COLUMN back_duration_min INTEGER;
+ALTER TABLE flights_archive ADD COLUMN out_date DATE;
+ALTER TABLE flights_archive ADD COLUMN back_date DATE;
+ALTER TABLE flights_archive ADD COLUMN out_dep_min INTEGER;
+ALTER TABLE flights_archive ADD COLUMN back_dep_min INTEGER;
+ALTER TABLE flights_archive ADD COLUMN trip_days INTEGER;
+ALTER TABLE flights_archive ADD COLUMN out_duration_min INTEGER;
+ALTER TABLE flights_archive ADD COLUMN back_duration_min INTEGER;
+CREATE INDEX IF NOT EXISTS ix_flights_out_dep ON flights(out_dep_min);
+CREATE INDEX IF NOT EXISTS ix_flights_trip_dep ON flights(trip_days, out_dep_min);
+CREATE INDEX IF NOT EXISTS ix_flights_dest_dep ON flights(dest_country_key, dest_city_key, out_dep_min);
+
+-- v8: backfill typed schedule
+-- (python migration: _backfill_typed_schedule)
+
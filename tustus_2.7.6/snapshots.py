@@ -0,0 +1,178 @@
+# snapshots.py
+# ארכיון snapshots של הדף: דחוס (zstd, או gzip אם zstandard לא מותקן), לפי hash של התוכן, עם חלון שמירה
+#
+#   objects/<2 תווים>/<sha256>.html.zst   — כל דף שונה נשמר פעם אחת
+#   index.tsv                             — שורה לכל שינוי: "<epoch>\t<sha256>\t<bytes>"
+#
+# טיק שהדף בו זהה לקודם לא כותב כלום. קריאה: iter_snapshots / read / replay, או מה-CLI:
+#   python snapshots.py list
+#   python snapshots.py cat <hash> > page.html
+from __future__ import annotations
+import argparse, gzip, hashlib, logging, os, pathlib, sys, threading, time
+from typing import Iterator, List, Optional, Tuple
+
+import config
+
+log = logging.getLogger("tustus.snapshots")
+
+try:
+    import zstandard
+except ImportError:  # gzip מהספרייה הסטנדרטית
+    zstandard = None
+
+SnapshotEntry = Tuple[int, str, int]  # (epoch, sha256, bytes לא דחוסים)
+
+def _compress(data: bytes) -> Tuple[bytes, str]:
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=10).compress(data), ".zst"
+    return gzip.compress(data, compresslevel=6), ".gz"
+
+def _decompress(data: bytes, ext: str) -> bytes:
+    if ext == ".zst":
+        if zstandard is None:
+            raise RuntimeError("snapshot is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+class SnapshotStore:
+    def __init__(self, root=None, retention_days: Optional[float] = None, max_count: Optional[int] = None):
+        self.root = pathlib.Path(root or getattr(config, "SNAPSHOT_DIR", config.DATA_DIR / "snapshots"))
+        self.retention_days = retention_days if retention_days is not None else getattr(config, "SNAPSHOT_RETENTION_DAYS", 7)
+        self.max_count = max_count if max_count is not None else getattr(config, "SNAPSHOT_MAX_COUNT", 5000)
+        self.index_path = self.root / "index.tsv"
+        self._lock = threading.Lock()
+        self._last_hash: Optional[str] = None
+        self._last_prune = 0.0
+
+    # ----- write -----
+
+    def _object_path(self, digest: str) -> Optional[pathlib.Path]:
+        d = self.root / "objects" / digest[:2]
+        for ext in (".zst", ".gz"):
+            p = d / f"{digest}.html{ext}"
+            if p.exists():
+                return p
+        return None
+
+    def put(self, body: bytes, digest: Optional[str] = None, ts: Optional[float] = None) -> str:
+        """שומר דף; מחזיר את ה-hash. דף זהה לאחרון = בלי כתיבה בכלל."""
+        digest = digest or hashlib.sha256(body).hexdigest()
+        with self._lock:
+            if self._last_hash is None:
+                last = self.latest()
+                self._last_hash = last[1] if last else ""
+            if digest == self._last_hash:
+                return digest
+            if self._object_path(digest) is None:
+                data, ext = _compress(body)
+                path = self.root / "objects" / digest[:2] / f"{digest}.html{ext}"
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(path.suffix + ".tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)  # אטומי: קורא לעולם לא רואה קובץ חלקי
+                log.info("snapshot %s stored | %d -> %d bytes", digest[:12], len(body), len(data))
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(f"{int(ts or time.time())}\t{digest}\t{len(body)}\n")
+            self._last_hash = digest
+        if time.time() - self._last_prune > 3600:
+            self.prune()
+        return digest
+
+    def prune(self) -> int:
+        """מוחק רשומות מחוץ לחלון השמירה ואובייקטים שאף רשומה לא מפנה אליהם."""
+        with self._lock:
+            self._last_prune = time.time()
+            entries = list(self.iter_snapshots())
+            cutoff = time.time() - self.retention_days * 86400 if self.retention_days else 0
+            keep = [e for e in entries if e[0] >= cutoff]
+            if self.max_count:
+                keep = keep[-self.max_count:]
+            if len(keep) == len(entries):
+                return 0
+            tmp = self.index_path.with_suffix(".tmp")
+            tmp.write_text("".join(f"{ts}\t{h}\t{n}\n" for ts, h, n in keep), encoding="utf-8")
+            os.replace(tmp, self.index_path)
+            live = {h for _, h, _ in keep}
+            removed = 0
+            for p in (self.root / "objects").glob("*/*.html.*"):
+                if p.name.split(".", 1)[0] not in live:
+                    p.unlink(missing_ok=True)
+                    removed += 1
+            log.info("snapshots pruned | entries %d -> %d | objects removed=%d", len(entries), len(keep), removed)
+            return removed
+
+    # ----- read -----
+
+    def iter_snapshots(self, since: Optional[float] = None, until: Optional[float] = None) -> Iterator[SnapshotEntry]:
+        """(epoch, hash, bytes) לפי סדר כרונולוגי, בלי לפתוח את האובייקטים עצמם."""
+        if not self.index_path.exists():
+            return
+        with open(self.index_path, encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 3:
+                    continue  # שורה חלקית (כתיבה שנקטעה)
+                ts = int(parts[0])
+                if since is not None and ts < since:
+                    continue
+                if until is not None and ts > until:
+                    break
+                yield ts, parts[1], int(parts[2])
+
+    def latest(self) -> Optional[SnapshotEntry]:
+        last = None
+        for last in self.iter_snapshots():
+            pass
+        return last
+
+    def read_bytes(self, digest: str) -> bytes:
+        path = self._object_path(digest)
+        if path is None:
+            raise KeyError(digest)
+        return _decompress(path.read_bytes(), path.suffix)
+
+    def read(self, digest: str) -> str:
+        return self.read_bytes(digest).decode("utf-8", errors="replace")
+
+    def replay(self, since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Tuple[int, str]]:
+        """(epoch, html) לכל שינוי בחלון — לכלים אופליין (benchmark, דיבוג פרסר)."""
+        for ts, digest, _ in self.iter_snapshots(since, until):
+            try:
+                yield ts, self.read(digest)
+            except KeyError:
+                continue
+
+_STORE: Optional[SnapshotStore] = None
+
+def get_store() -> Optional[SnapshotStore]:
+    # None כשהארכיון כבוי ב-config
+    global _STORE
+    if not getattr(config, "SNAPSHOTS_ENABLED", True):
+        return None
+    if _STORE is None:
+        _STORE = SnapshotStore()
+    return _STORE
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="tustus page snapshot archive")
+    ap.add_argument("--root", help="archive dir (default: config.SNAPSHOT_DIR)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list")
+    p_cat = sub.add_parser("cat")
+    p_cat.add_argument("hash", help="full hash or unique prefix")
+    sub.add_parser("prune")
+    args = ap.parse_args(argv)
+    store = SnapshotStore(args.root)
+    if args.cmd == "list":
+        for ts, digest, n in store.iter_snapshots():
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))}\t{digest}\t{n}")
+    elif args.cmd == "cat":
+        matches = {h for _, h, _ in store.iter_snapshots() if h.startswith(args.hash)}
+        if len(matches) != 1:
+            raise SystemExit(f"{len(matches)} snapshots match {args.hash!r}")
+        sys.stdout.write(store.read(matches.pop()))
+    elif args.cmd == "prune":
+        print(store.prune())
+
+if __name__ == "__main__":
+    main()
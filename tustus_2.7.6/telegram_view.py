@@ -1,6 +1,9 @@
 # telegram_view.py
 from __future__ import annotations
-from typing import List, Tuple, Iterable
+import html
+from collections import OrderedDict
+from datetime import date
+from typing import List, Optional, Tuple, Iterable
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton
 
 # מפה ממדינה לדגל (נוסיף עוד בהדרגה; ברירת מחדל בלי דגל)
@@ -59,3 +62,72 @@ def build_destinations_keyboard(rows: Iterable[Tuple[str, str, object]], selecte
         InlineKeyboardButton("סיכום יעדים 📊", callback_data="sum"),
     ])
     return InlineKeyboardMarkup(keyboard)
+
+class KeyboardCache:
+    """
+    LRU של InlineKeyboardMarkup מוכנים, לפי (generation, selected).
+    generation = מונה שהמוניטור מקדם כשטיק שינה את הנתונים (bot_data["render_gen"]).
+    generation חדש מנקה את כל מה שנבנה לפניו; בנייה שהתחילה לפני הקידום לא נשמרת.
+    """
+    def __init__(self, size: int = 64):
+        self.size = size
+        self.generation = 0
+        self._items: "OrderedDict[str, InlineKeyboardMarkup]" = OrderedDict()
+        self.hits = self.misses = 0
+
+    def _sync(self, generation: int) -> bool:
+        # False = generation ישן (בקשה שהתחילה לפני הטיק) — לא קוראים ולא שומרים
+        if generation > self.generation:
+            self._items.clear()
+            self.generation = generation
+        return generation == self.generation
+
+    def get(self, generation: int, selected: str) -> Optional[InlineKeyboardMarkup]:
+        km = self._items.get(selected) if self._sync(generation) else None
+        if km is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(selected)
+        self.hits += 1
+        return km
+
+    def put(self, generation: int, selected: str, km: InlineKeyboardMarkup) -> None:
+        if not self._sync(generation):
+            return
+        self._items[selected] = km
+        self._items.move_to_end(selected)
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+def _short_date(iso: Optional[str]) -> str:
+    # "2025-09-03" -> "03/09"; ערך לא תקין = ""
+    try:
+        return date.fromisoformat(iso).strftime("%d/%m") if iso else ""
+    except ValueError:
+        return ""
+
+def render_search_results(query: str, rows) -> str:
+    """
+    תוצאות /search כ-HTML: שורה לכל טיסה — דגל, יעד, מחיר, הלוך (תאריך ושעה) / חזור, וקישור.
+    rows: שורות מ-db.search_flights (out_date/back_date המוקלדים — לא הטקסט הגולמי של הכרטיס).
+    """
+    q = html.escape(query)
+    if not rows:
+        return f"🔎 לא נמצאו טיסות עבור <b>{q}</b>"
+    lines = [f"🔎 תוצאות עבור <b>{q}</b>:"]
+    for r in rows:
+        dest = r["destination"] or " - ".join(x for x in (r["dest_city"], r["dest_country"]) if x)
+        price = r["price_text"] or (f"{r['price']:g} {r['currency'] or ''}".strip() if r["price"] is not None else "")
+        out_d, back_d = _short_date(r["out_date"]), _short_date(r["back_date"])
+        when = " ".join(x for x in (out_d, r["out_from_time"] if out_d else "") if x)
+        if when and back_d:
+            when += f" – {back_d}"
+        when = f" | {html.escape(when)}" if when else ""
+        line = f"{flag_for(r['dest_country'])} {html.escape(dest)} — {html.escape(price)}{when}"
+        if r["url"]:
+            line += f' | <a href="{html.escape(r["url"], quote=True)}">הזמנה</a>'
+        lines.append(line.strip())
+    return "\n".join(lines)